@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
@@ -10,6 +11,8 @@ from taggit.managers import TaggableManager
 class User(AbstractUser):
     bio = models.TextField(max_length=500, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True)
+    # Resized copies of profile_picture, filled in by blog.thumbnails
+    profile_picture_renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         db_table = 'auth_user'  
@@ -17,6 +20,17 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    @property
+    def avatars(self):
+        """{size: {format: url}}, e.g. user.avatars.small.webp in templates; {} until rendered"""
+        renditions = self.profile_picture_renditions or {}
+        if not self.profile_picture or renditions.get('source') != self.profile_picture.name:
+            return {}
+        return {
+            size: {image_format: default_storage.url(name) for image_format, name in formats.items()}
+            for size, formats in renditions.items() if size != 'source'
+        }
+
 class Post(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
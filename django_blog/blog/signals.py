@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import User
+from .thumbnails import schedule
+
+
+@receiver(post_save, sender=User)
+def resize_profile_picture(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'profile_picture' not in update_fields:
+        return
+    if instance.profile_picture and instance.profile_picture_renditions.get('source') != instance.profile_picture.name:
+        schedule(instance)
@@ -0,0 +1,96 @@
+"""
+Avatar renditions for User.profile_picture.
+
+Uploads are resized on a small background thread pool into square WebP
+and JPEG files, one per size in THUMBNAIL_SIZES, named by content hash
+(blog/signals.py schedules the work; THUMBNAILS_ASYNC = False runs it
+inline). Templates read User.avatars instead of the original file.
+"""
+import atexit
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'webp': ('WEBP', {'quality': 80}), 'jpeg': ('JPEG', {'quality': 85, 'optimize': True})}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_sizes():
+    return getattr(settings, 'THUMBNAIL_SIZES', {'small': 48, 'medium': 160})
+
+
+def _save(content, size_name, extension):
+    name = f'profile_pics/renditions/{hashlib.sha256(content).hexdigest()[:20]}_{size_name}.{extension}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def build_renditions(user_id, source_name):
+    from .models import User
+
+    sizes = get_sizes()
+    try:
+        with default_storage.open(source_name) as source:
+            image = Image.open(source)
+            image.draft('RGB', (max(sizes.values()) * 2,) * 2)
+            image = ImageOps.exif_transpose(image)
+            renditions = {'source': source_name}
+            for size_name, size in sizes.items():
+                square = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+                renditions[size_name] = {}
+                for extension, (image_format, options) in FORMATS.items():
+                    output = io.BytesIO()
+                    (square if image_format == 'WEBP' else square.convert('RGB')).save(output, image_format, **options)
+                    renditions[size_name][extension] = _save(output.getvalue(), size_name, extension)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning("Could not resize profile picture %s", source_name, exc_info=True)
+        return None
+
+    # Ignore the result if the picture changed while it was rendering
+    User.objects.filter(pk=user_id, profile_picture=source_name).update(profile_picture_renditions=renditions)
+    return renditions
+
+
+def _run(user_id, source_name):
+    close_old_connections()
+    try:
+        build_renditions(user_id, source_name)
+    except Exception:
+        # The executor would otherwise keep the exception on a future nobody reads
+        logger.exception("Avatar rendition failed for user %s", user_id)
+    finally:
+        close_old_connections()
+
+
+def _shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+
+
+def schedule(user):
+    global _executor
+    user_id, source_name = user.pk, user.profile_picture.name
+    if not getattr(settings, 'THUMBNAILS_ASYNC', True):
+        transaction.on_commit(lambda: build_renditions(user_id, source_name))
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'THUMBNAILS_WORKERS', 2),
+                                           thread_name_prefix='avatars')
+    transaction.on_commit(lambda: _executor.submit(_run, user_id, source_name))
+
+
+atexit.register(_shutdown)
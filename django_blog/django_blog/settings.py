@@ -154,4 +154,7 @@ LOGOUT_REDIRECT_URL = 'login'
 
 # For media files (profile pictures)
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Square avatar renditions of profile pictures (blog.thumbnails), in pixels
+THUMBNAIL_SIZES = {'small': 48, 'medium': 160}
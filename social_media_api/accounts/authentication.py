@@ -0,0 +1,140 @@
+"""
+Token authentication with a cached token -> user lookup.
+
+DRF's TokenAuthentication joins authtoken_token to the user table on every
+request. CachedTokenAuthentication keeps the result in a per-process LRU
+(TOKEN_AUTH_CACHE_SIZE entries, TOKEN_AUTH_CACHE_TTL seconds). When
+TOKEN_AUTH_SHARED_CACHE is on, the default Django cache sits behind it as
+a second tier shared by every process.
+
+Only stable user columns are cached. Columns that change through
+queryset.update() (the follow counters and the notification watermark)
+and the password hash are left deferred, so reading them always hits the
+database. accounts.signals invalidates entries on user save or delete
+and on token delete. That covers logout, password changes and
+deactivation done through save(). The TTL bounds everything else,
+including local entries in other processes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .lru import LRUCache
+from .models import CustomUser
+
+UNCACHED_FIELDS = ('password', 'followers_count', 'following_count', 'notifications_read_at')
+
+
+def get_cache_size():
+    return getattr(settings, 'TOKEN_AUTH_CACHE_SIZE', 10000)
+
+
+def get_cache_ttl():
+    return getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60)
+
+
+def use_shared_cache():
+    return getattr(settings, 'TOKEN_AUTH_SHARED_CACHE', False)
+
+
+def shared_cache_key(key):
+    return f'auth:token:{key}'
+
+
+def user_token_cache_key(user_id):
+    return f'auth:user-token:{user_id}'
+
+
+# token key -> (field names, values) of the user row
+local_tokens = LRUCache(get_cache_size, get_cache_ttl)
+
+
+def _cached_fields():
+    return [field.attname for field in CustomUser._meta.concrete_fields if field.attname not in UNCACHED_FIELDS]
+
+
+def _entry_for(user):
+    fields = _cached_fields()
+    return fields, tuple(getattr(user, f) for f in fields)
+
+
+def _load(key):
+    fields = _cached_fields()
+    try:
+        token = Token.objects.select_related('user').only(*('key', *(f'user__{f}' for f in fields))).get(key=key)
+    except Token.DoesNotExist:
+        return None
+    return _entry_for(token.user)
+
+
+def _build_user(entry):
+    # A fresh instance per request, so no request sees another's mutations
+    fields, values = entry
+    return CustomUser.from_db(DEFAULT_DB_ALIAS, fields, values)
+
+
+def get_token_user(key):
+    """User for a token key, or None if there is no such token"""
+    entry = local_tokens.get(key)
+    if entry is None and use_shared_cache():
+        entry = cache.get(shared_cache_key(key))
+        if entry is not None:
+            local_tokens.set(key, entry)
+    if entry is None:
+        entry = _load(key)
+        if entry is None:
+            return None
+        local_tokens.set(key, entry)
+        if use_shared_cache():
+            cache.set(shared_cache_key(key), entry, get_cache_ttl())
+    return _build_user(entry)
+
+
+def get_or_create_token_key(user):
+    """
+    Token key for a user who just logged in.
+
+    With TOKEN_AUTH_SHARED_CACHE on, the user -> key mapping is also kept in
+    the Django cache, so deleting a token (logout) reaches every process.
+    Without it the cache may be per-process (LocMemCache), where another
+    process could hand out a deleted key, so the key is always read from
+    the database. The key -> user entry is filled here, so the first
+    request after login skips the database as well.
+    """
+    key = cache.get(user_token_cache_key(user.id)) if use_shared_cache() else None
+    if key is None:
+        key = Token.objects.get_or_create(user=user)[0].key
+        if use_shared_cache():
+            cache.set(user_token_cache_key(user.id), key, get_cache_ttl())
+    local_tokens.set(key, _entry_for(user))
+    return key
+
+
+def invalidate_token(key, user_id=None):
+    local_tokens.discard(key)
+    if use_shared_cache():
+        cache.delete(shared_cache_key(key))
+        if user_id is not None:
+            cache.delete(user_token_cache_key(user_id))
+
+
+def invalidate_user_tokens(user_id):
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in replacement for TokenAuthentication backed by get_token_user"""
+
+    def authenticate_credentials(self, key):
+        user = get_token_user(key)
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        # request.auth only needs the key; the row itself is never re-read
+        return user, Token(key=key, user=user)
@@ -0,0 +1,112 @@
+"""
+Follow-graph lookups backed by an in-process adjacency cache.
+
+Each user's outgoing (following) and incoming (followers) edges are kept
+as a sorted array of user ids, so membership is a binary search and
+intersections are a linear merge. Entries live in an LRU of
+FOLLOW_GRAPH_CACHE_SIZE users. accounts.signals invalidates them whenever
+edges change, and FOLLOW_GRAPH_CACHE_TTL bounds how stale an entry can be
+after a write made by another process.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .lru import LRUCache
+
+FOLLOWING = 'following'
+FOLLOWERS = 'followers'
+
+
+def get_cache_size():
+    return getattr(settings, 'FOLLOW_GRAPH_CACHE_SIZE', 10000)
+
+
+def get_cache_ttl():
+    return getattr(settings, 'FOLLOW_GRAPH_CACHE_TTL', 60)
+
+
+# (direction, user_id) -> sorted array of ids
+adjacency = LRUCache(get_cache_size, get_cache_ttl)
+
+
+def _load(direction, user_id):
+    # Through rows (from_customuser=X, to_customuser=Y) mean Y follows X
+    edges = get_user_model().followers.through.objects
+    if direction == FOLLOWING:
+        ids = edges.filter(to_customuser_id=user_id).values_list('from_customuser_id', flat=True)
+    else:
+        ids = edges.filter(from_customuser_id=user_id).values_list('to_customuser_id', flat=True)
+    return array('q', sorted(ids))
+
+
+def _adjacent(direction, user_id):
+    ids = adjacency.get((direction, user_id))
+    if ids is None:
+        ids = _load(direction, user_id)
+        adjacency.set((direction, user_id), ids)
+    return ids
+
+
+def following_ids(user_id):
+    """Sorted ids of the users `user_id` follows"""
+    return _adjacent(FOLLOWING, user_id)
+
+
+def follower_ids(user_id):
+    """Sorted ids of the users following `user_id`"""
+    return _adjacent(FOLLOWERS, user_id)
+
+
+def _contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def _intersect(a, b):
+    """Merge two sorted id arrays, keeping the ids found in both"""
+    result, i, j = [], 0, 0
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]:
+            result.append(a[i])
+            i += 1
+            j += 1
+        elif a[i] < b[j]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def is_following(follower_id, followee_id):
+    return _contains(following_ids(follower_id), followee_id)
+
+
+def are_following(follower_id, user_ids):
+    """{user_id: bool} for each of `user_ids`, from a single adjacency lookup"""
+    ids = following_ids(follower_id)
+    return {user_id: _contains(ids, user_id) for user_id in user_ids}
+
+
+def common_following(user_id, other_id):
+    """Users followed by both `user_id` and `other_id`"""
+    return _intersect(following_ids(user_id), following_ids(other_id))
+
+
+def followers_you_follow(user_id, target_id):
+    """Followers of `target_id` that `user_id` also follows"""
+    return _intersect(following_ids(user_id), follower_ids(target_id))
+
+
+def invalidate(followers=(), followees=()):
+    """Drop cached adjacency touched by edges from `followers` to `followees`"""
+    for user_id in followers:
+        adjacency.discard((FOLLOWING, user_id))
+    for user_id in followees:
+        adjacency.discard((FOLLOWERS, user_id))
+
+
+def invalidate_user(user_id):
+    invalidate([user_id], [user_id])
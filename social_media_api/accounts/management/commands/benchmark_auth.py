@@ -0,0 +1,43 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+
+from accounts.authentication import CachedTokenAuthentication, local_tokens
+from accounts.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Measure per-request token authentication overhead, uncached vs cached"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        # Everything runs in a transaction that is rolled back, so no test user is left behind
+        with transaction.atomic():
+            user = CustomUser.objects.create_user(username='__auth_benchmark__', password='unused')
+            token = Token.objects.create(user=user)
+            request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {token.key}')
+            local_tokens.clear()
+
+            for name, authentication in (('TokenAuthentication', TokenAuthentication()),
+                                         ('CachedTokenAuthentication', CachedTokenAuthentication())):
+                timings = []
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(options['requests']):
+                        start = time.perf_counter()
+                        authentication.authenticate(Request(request))
+                        timings.append(time.perf_counter() - start)
+                self.stdout.write(
+                    f"{name}: median {statistics.median(timings) * 1e6:.1f} us, "
+                    f"p99 {sorted(timings)[int(len(timings) * 0.99)] * 1e6:.1f} us, "
+                    f"{len(queries) / options['requests']:.3f} queries/request"
+                )
+            transaction.set_rollback(True)
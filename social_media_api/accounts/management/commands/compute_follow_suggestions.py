@@ -0,0 +1,24 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from accounts.recommendations import compute_suggestions
+
+
+class Command(BaseCommand):
+    help = "Precompute friends-of-friends follow suggestions for every user"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=20, help="Suggestions kept per user")
+        parser.add_argument('--shard-size', type=int, default=5000, help="Users per worker task")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes; 1 computes inline")
+
+    def handle(self, *args, **options):
+        written = compute_suggestions(
+            top_k=options['top_k'],
+            shard_size=options['shard_size'],
+            workers=options['workers'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} follow suggestions"))
@@ -0,0 +1,136 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from rest_framework.authtoken.models import Token
+
+from accounts.models import CustomUser
+
+FIELDS = ('username', 'email', 'password', 'bio')
+
+
+def hash_passwords(passwords):
+    """Runs in a worker process; None becomes an unusable password"""
+    return [make_password(password or None) for password in passwords]
+
+
+def read_records(path, file_format):
+    """Yield one dict per input row, streaming"""
+    with open(path, newline='', encoding='utf-8') as handle:
+        if file_format == 'csv':
+            yield from csv.DictReader(handle)
+        else:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = "Import users from CSV or JSONL (username, email, password, bio), creating a token for each"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Input format; guessed from the file extension by default")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows per transaction")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Password hashing processes; 1 hashes inline")
+        parser.add_argument('--checkpoint', help="Progress file for resuming; defaults to <path>.checkpoint")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        batch_size = options['batch_size']
+
+        done = self.read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f"Resuming after {done} rows")
+        records = islice(read_records(path, file_format), done, None)
+
+        pool = None
+        if options['workers'] > 1:
+            # Forked workers must not inherit open database connections
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=options['workers'])
+        created = skipped = 0
+        started = time.monotonic()
+        try:
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+                batch_created = self.import_batch(batch, pool, options['workers'])
+                created += batch_created
+                skipped += len(batch) - batch_created
+                done += len(batch)
+                # Only record progress once the batch has committed
+                self.write_checkpoint(checkpoint, done)
+                self.stdout.write(f"{done} rows read, {created} created, {skipped} skipped, "
+                                  f"{created / (time.monotonic() - started):.0f} users/s")
+        finally:
+            if pool:
+                pool.shutdown()
+
+        # Nothing was checkpointed if the input had no rows
+        with suppress(FileNotFoundError):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} users ({skipped} skipped)"))
+
+    def import_batch(self, batch, pool, workers):
+        rows = {}
+        for record in batch:
+            username = (record.get('username') or '').strip()
+            if username and username not in rows:
+                rows[username] = record
+        existing = set(CustomUser.objects.filter(username__in=rows).values_list('username', flat=True))
+        rows = [record for username, record in rows.items() if username not in existing]
+        if not rows:
+            return 0
+
+        passwords = [record.get('password') for record in rows]
+        if pool:
+            chunk = max(1, len(passwords) // workers)
+            chunks = [passwords[i:i + chunk] for i in range(0, len(passwords), chunk)]
+            hashed = [password for part in pool.map(hash_passwords, chunks) for password in part]
+        else:
+            hashed = hash_passwords(passwords)
+
+        users = [
+            CustomUser(
+                username=record['username'].strip(),
+                email=CustomUser.objects.normalize_email(record.get('email') or ''),
+                bio=record.get('bio') or '',
+                password=password,
+            )
+            for record, password in zip(rows, hashed)
+        ]
+        with transaction.atomic():
+            users = CustomUser.objects.bulk_create(users)
+            if users and users[0].pk is None:
+                # Backends that cannot return ids from a bulk insert
+                users = list(CustomUser.objects.filter(username__in=[user.username for user in users]))
+            Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users])
+        return len(users)
+
+    def read_checkpoint(self, checkpoint):
+        try:
+            with open(checkpoint) as handle:
+                return int(handle.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            raise CommandError(f"Unreadable checkpoint file {checkpoint}")
+
+    def write_checkpoint(self, checkpoint, done):
+        temporary = f'{checkpoint}.tmp'
+        with open(temporary, 'w') as handle:
+            handle.write(str(done))
+        os.replace(temporary, checkpoint)
@@ -0,0 +1,58 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from accounts.models import CustomUser
+
+USERNAME_PREFIX = '__login_loadtest_'
+PASSWORD = 'loadtest-password'
+
+
+class Command(BaseCommand):
+    help = "Measure login/ throughput with concurrent clients, token-only vs with a session"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help="Distinct accounts logging in")
+        parser.add_argument('--concurrency', type=int, default=8, help="Client threads")
+        parser.add_argument('--logins', type=int, default=200, help="Logins per scenario")
+
+    def handle(self, *args, **options):
+        users = [CustomUser.objects.create_user(username=f'{USERNAME_PREFIX}{i}', password=PASSWORD)
+                 for i in range(options['users'])]
+        try:
+            # The test client talks to the app in-process, as host "testserver"
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for scenario, session in (('token-only', False), ('with session', True)):
+                    self.run_scenario(scenario, session, users, options)
+        finally:
+            CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+    def run_scenario(self, scenario, session, users, options):
+        def login(index):
+            user = users[index % len(users)]
+            start = time.perf_counter()
+            response = Client().post('/api/auth/login/', {
+                'username': user.username, 'password': PASSWORD, 'session': session,
+            }, content_type='application/json')
+            elapsed = time.perf_counter() - start
+            connections.close_all()
+            return response.status_code, elapsed
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(login, range(options['logins'])))
+        wall = time.perf_counter() - start
+
+        timings = sorted(elapsed for _, elapsed in results)
+        failures = sum(1 for status, _ in results if status != 200)
+        self.stdout.write(
+            f"{scenario}: {len(results) / wall:.1f} logins/s, "
+            f"p50 {statistics.median(timings) * 1000:.1f} ms, "
+            f"p95 {timings[int(len(timings) * 0.95)] * 1000:.1f} ms, "
+            f"{failures} failed"
+        )
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:12
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    Follow = CustomUser.followers.through
+
+    def count(field):
+        rows = (Follow.objects.filter(**{field: OuterRef('pk')})
+                .order_by().values(field).annotate(total=Count('pk')).values('total'))
+        return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+    CustomUser.objects.update(
+        followers_count=count('from_customuser'),
+        following_count=count('to_customuser'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_customuser_followers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customuser_followers_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='notifications_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
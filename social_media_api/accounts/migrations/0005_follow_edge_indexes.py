@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Follower/following pages filter the auto-created through table on one
+    side and walk its ids newest first. The through model takes no Meta
+    indexes, so they are created in SQL.
+    """
+
+    dependencies = [
+        ('accounts', '0004_customuser_notifications_read_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX follow_followee_edge_idx ON accounts_customuser_followers (from_customuser_id, id)',
+            'DROP INDEX follow_followee_edge_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX follow_follower_edge_idx ON accounts_customuser_followers (to_customuser_id, id)',
+            'DROP INDEX follow_follower_edge_idx',
+        ),
+    ]
@@ -1,36 +1,63 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from . import graph
+
 class CustomUser(AbstractUser):
     bio = models.TextField(max_length=500, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # Resized copies of profile_picture, written by accounts.thumbnails
+    profile_picture_renditions = models.JSONField(default=dict, blank=True, editable=False)
     followers = models.ManyToManyField('self', symmetrical=False, related_name='following', blank=True)
+    # Denormalized counters, kept in step by accounts.signals
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # Notifications up to this time count as read unless marked otherwise
+    notifications_read_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         return self.username
     
     def follow(self, user):
         """Follow another user"""
-        if user != self and not self.following.filter(id=user.id).exists():
+        if user != self and not graph.is_following(self.id, user.id):
             self.following.add(user)
             return True
         return False
     
     def unfollow(self, user):
         """Unfollow a user"""
-        if self.following.filter(id=user.id).exists():
+        if graph.is_following(self.id, user.id):
             self.following.remove(user)
             return True
         return False
     
     def is_following(self, user):
         """Check if following a user"""
-        return self.following.filter(id=user.id).exists()
+        return graph.is_following(self.id, user.id)
     
     def get_followers_count(self):
         """Get number of followers"""
-        return self.followers.count()
+        return self.followers_count
     
     def get_following_count(self):
         """Get number of users being followed"""
-        return self.following.count()
\ No newline at end of file
+        return self.following_count
+
+class FollowSuggestion(models.Model):
+    """Precomputed "people you may know" rows, rebuilt by compute_follow_suggestions"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='follow_suggestions')
+    suggested = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    # Number of people `user` follows who follow `suggested`
+    mutual_count = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['user', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'rank'], name='follow_suggestion_rank_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} -> {self.suggested}"
@@ -0,0 +1,44 @@
+import base64
+
+from rest_framework.exceptions import NotFound
+
+from posts.pagination import KeysetPagination
+
+
+def encode_id_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode()).decode().rstrip('=')
+
+
+def decode_id_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise NotFound("Invalid cursor.")
+
+
+class IdKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination on the primary key alone, newest first.
+
+    Used for follow edges: the through table has no timestamp, but its ids
+    grow with every follow, so they give the same stable ordering.
+    """
+    page_size = 50
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.total = None
+        queryset = queryset.order_by('-id')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(id__lt=decode_id_cursor(cursor))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_cursor = encode_id_cursor(rows[-1].id) if self.has_next else None
+        return rows
@@ -0,0 +1,130 @@
+"""
+Offline "people you may know" suggestions.
+
+The follow graph is loaded once into a compressed sparse row (CSR)
+adjacency matrix A, where row u lists the users u follows. Friends of
+friends are the non-zero entries of row u in A·A, and their values count
+the mutual connections. Rows are computed in user-id shards by a process
+pool, and only the top K per user are kept. The results replace the rows
+in FollowSuggestion, so the endpoint only has to read them.
+
+Only the standard library is used. The arrays and the per-row sparse
+product follow the layout SciPy would use, without adding a dependency.
+"""
+import heapq
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+from django.db import connections, transaction
+
+from .models import CustomUser, FollowSuggestion
+
+# Set in each worker by _init_worker (or directly when running inline)
+_matrix = None
+
+
+class Adjacency:
+    """CSR matrix over dense user indices: row i holds the indices user i follows"""
+
+    def __init__(self, user_ids, indptr, indices):
+        self.user_ids = user_ids  # dense index -> user id, ascending
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_database(cls):
+        user_ids = array('q', CustomUser.objects.order_by('id').values_list('id', flat=True))
+        position = {user_id: index for index, user_id in enumerate(user_ids)}
+        # Through rows (from_customuser=X, to_customuser=Y) mean Y follows X
+        edges = (CustomUser.followers.through.objects
+                 .order_by('to_customuser_id', 'from_customuser_id')
+                 .values_list('to_customuser_id', 'from_customuser_id'))
+
+        indptr = array('q', [0]) * (len(user_ids) + 1)
+        indices = array('q')
+        for follower_id, followee_ids in groupby(edges.iterator(chunk_size=10000), key=lambda edge: edge[0]):
+            row = position.get(follower_id)
+            if row is None:
+                continue  # joined after the user list was read
+            indices.extend(sorted(position[followee_id] for _, followee_id in followee_ids
+                                  if followee_id in position))
+            indptr[row + 1] = len(indices)
+        # Rows with no edges inherit the previous end offset
+        for row in range(1, len(indptr)):
+            indptr[row] = max(indptr[row], indptr[row - 1])
+        return cls(user_ids, indptr, indices)
+
+    def row(self, index):
+        return self.indices[self.indptr[index]:self.indptr[index + 1]]
+
+    def __len__(self):
+        return len(self.user_ids)
+
+
+def suggest_for_row(matrix, index, top_k):
+    """Top-K (mutual_count, index) for one user: row `index` of A·A minus A and the user"""
+    following = matrix.row(index)
+    scores = {}
+    for followee in following:
+        for candidate in matrix.row(followee):
+            scores[candidate] = scores.get(candidate, 0) + 1
+    scores.pop(index, None)
+    for followee in following:
+        scores.pop(followee, None)
+    # Most mutual connections first, lower ids breaking ties
+    return heapq.nsmallest(top_k, ((-score, candidate) for candidate, score in scores.items()))
+
+
+def _init_worker(matrix):
+    global _matrix
+    _matrix = matrix
+
+
+def suggest_for_shard(bounds, top_k):
+    """Suggestions for the dense indices in [start, stop), as (user_id, suggested_id, mutual_count, rank)"""
+    start, stop = bounds
+    user_ids = _matrix.user_ids
+    rows = []
+    for index in range(start, stop):
+        for rank, (score, candidate) in enumerate(suggest_for_row(_matrix, index, top_k)):
+            rows.append((user_ids[index], user_ids[candidate], -score, rank))
+    return bounds, rows
+
+
+def write_shard(matrix, bounds, rows):
+    """Replace the stored suggestions of every user in the shard"""
+    start, stop = bounds
+    first_id, last_id = matrix.user_ids[start], matrix.user_ids[stop - 1]
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id__gte=first_id, user_id__lte=last_id).delete()
+        FollowSuggestion.objects.bulk_create(
+            [FollowSuggestion(user_id=user_id, suggested_id=suggested_id, mutual_count=count, rank=rank)
+             for user_id, suggested_id, count, rank in rows],
+            batch_size=5000,
+        )
+
+
+def compute_suggestions(top_k=20, shard_size=5000, workers=1, log=None):
+    """Rebuild FollowSuggestion for every user. Returns the number of rows written."""
+    matrix = Adjacency.from_database()
+    shards = [(start, min(start + shard_size, len(matrix))) for start in range(0, len(matrix), shard_size)]
+    if log:
+        log(f"{len(matrix)} users, {len(matrix.indices)} follow edges, {len(shards)} shards")
+
+    written = 0
+    if workers > 1:
+        # Workers only compute; every database write stays in this process. Close
+        # connections first so forked workers do not inherit (and later tear down) them.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrix,)) as pool:
+            for bounds, rows in pool.map(suggest_for_shard, shards, [top_k] * len(shards)):
+                write_shard(matrix, bounds, rows)
+                written += len(rows)
+    else:
+        _init_worker(matrix)
+        for shard in shards:
+            bounds, rows = suggest_for_shard(shard, top_k)
+            write_shard(matrix, bounds, rows)
+            written += len(rows)
+    return written
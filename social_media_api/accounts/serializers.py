@@ -1,8 +1,12 @@
+from django.db import models
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
-from .models import CustomUser
+from . import graph
+from .thumbnails import rendition_urls
+from .authentication import get_or_create_token_key
+from .models import CustomUser, FollowSuggestion
 from django.contrib.auth import get_user_model
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -32,6 +36,8 @@ class UserLoginSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField(write_only=True)
     token = serializers.CharField(read_only=True)
+    # Also start a browser session; token-only API clients leave this off
+    session = serializers.BooleanField(required=False, default=None, allow_null=True)
     
     def validate(self, data):
         username = data.get('username')
@@ -41,10 +47,8 @@ class UserLoginSerializer(serializers.Serializer):
             user = authenticate(username=username, password=password)
             if user:
                 if user.is_active:
-                    # Get or create token for the user
-                    token, created = Token.objects.get_or_create(user=user)
                     data['user'] = user
-                    data['token'] = token.key
+                    data['token'] = get_or_create_token_key(user)
                     return data
                 else:
                     raise serializers.ValidationError("User account is disabled.")
@@ -53,33 +57,92 @@ class UserLoginSerializer(serializers.Serializer):
         else:
             raise serializers.ValidationError("Must include 'username' and 'password'.")
 
-class UserFollowSerializer(serializers.ModelSerializer):
+class FollowStateListSerializer(serializers.ListSerializer):
+    """
+    Resolves the requester's follow state for a whole page of users in one
+    IN query, and shares it with the child serializer through the context.
+    """
+    def to_representation(self, data):
+        users = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated and users:
+            ids = [user.id for user in users]
+            edges = CustomUser.followers.through.objects.filter(
+                to_customuser_id=request.user.id, from_customuser_id__in=ids)
+            following = set(edges.values_list('from_customuser_id', flat=True))
+            self.context.setdefault('follow_state', {}).update((pk, pk in following) for pk in ids)
+        return super().to_representation(users)
+
+
+class ProfilePictureMixin:
+    """Rendition URLs, so avatar lists never download the original upload"""
+    
+    def get_profile_picture_renditions(self, obj):
+        request = self.context.get('request')
+        return rendition_urls(getattr(obj, 'suggested', obj), request.build_absolute_uri if request else None)
+
+
+class FollowStateMixin:
+    """is_following and follower counts that cost no queries per user"""
+    
+    def get_followers_count(self, obj):
+        return obj.get_followers_count()
+    
+    def get_following_count(self, obj):
+        return obj.get_following_count()
+    
+    def get_is_following(self, obj):
+        request = self.context.get('request')
+        if not (request and request.user.is_authenticated):
+            return False
+        follow_state = self.context.get('follow_state', {})
+        if obj.id in follow_state:
+            return follow_state[obj.id]
+        return graph.is_following(request.user.id, obj.id)
+
+
+class UserFollowSerializer(ProfilePictureMixin, FollowStateMixin, serializers.ModelSerializer):
+    profile_picture_renditions = serializers.SerializerMethodField()
+    followers_count = serializers.SerializerMethodField()
+    following_count = serializers.SerializerMethodField()
+    is_following = serializers.SerializerMethodField()
+    
     class Meta:
         model = get_user_model()
-        fields = ('id', 'username', 'profile_picture')
+        fields = ('id', 'username', 'profile_picture', 'profile_picture_renditions',
+                  'followers_count', 'following_count', 'is_following')
+        list_serializer_class = FollowStateListSerializer
 
-class UserProfileWithFollowInfoSerializer(serializers.ModelSerializer):
+class UserProfileWithFollowInfoSerializer(ProfilePictureMixin, FollowStateMixin, serializers.ModelSerializer):
+    profile_picture_renditions = serializers.SerializerMethodField()
     followers_count = serializers.SerializerMethodField()
     following_count = serializers.SerializerMethodField()
     is_following = serializers.SerializerMethodField()
     
     class Meta:
         model = get_user_model()
-        fields = ('id', 'username', 'email', 'bio', 'profile_picture', 
+        fields = ('id', 'username', 'email', 'bio', 'profile_picture', 'profile_picture_renditions',
                  'followers_count', 'following_count', 'is_following')
         read_only_fields = ('id', 'username', 'followers_count', 'following_count', 'is_following')
+        list_serializer_class = FollowStateListSerializer
+
+
+class FollowSuggestionSerializer(ProfilePictureMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField(source='suggested.id')
+    username = serializers.CharField(source='suggested.username')
+    profile_picture = serializers.ImageField(source='suggested.profile_picture')
+    profile_picture_renditions = serializers.SerializerMethodField()
+    followers_count = serializers.IntegerField(source='suggested.followers_count')
     
-    def get_followers_count(self, obj):
-        return obj.get_followers_count()
-    
-    def get_following_count(self, obj):
-        return obj.get_following_count()
-    
-    def get_is_following(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return request.user.is_following(obj)
-        return False
+    class Meta:
+        model = FollowSuggestion
+        fields = ('id', 'username', 'profile_picture', 'profile_picture_renditions', 'followers_count',
+                  'mutual_count')
+
+
+class BulkFollowSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                     max_length=500)
 
 
 UserProfileSerializer = UserProfileWithFollowInfoSerializer
\ No newline at end of file
@@ -0,0 +1,101 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from . import graph
+from .authentication import invalidate_token, invalidate_user_tokens
+from .thumbnails import schedule_renditions
+from .models import CustomUser
+
+
+def _existing_edges(instance, reverse, pk_set):
+    """Follow edges among pk_set that really exist, before they are removed"""
+    through = CustomUser.followers.through
+    if reverse:
+        edges = through.objects.filter(to_customuser=instance)
+        if pk_set is not None:
+            edges = edges.filter(from_customuser__in=pk_set)
+        return set(edges.values_list('from_customuser_id', flat=True))
+    edges = through.objects.filter(from_customuser=instance)
+    if pk_set is not None:
+        edges = edges.filter(to_customuser__in=pk_set)
+    return set(edges.values_list('to_customuser_id', flat=True))
+
+
+@receiver(m2m_changed, sender=CustomUser.followers.through)
+def update_follow_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    """Adjust followers_count/following_count with F() as edges come and go"""
+    # remove() reports every requested id, so record which edges actually exist
+    if action in ('pre_remove', 'pre_clear'):
+        instance._removed_follow_ids = _existing_edges(instance, reverse, pk_set)
+        return
+
+    if action == 'post_add':
+        changed, delta = pk_set, 1
+    elif action in ('post_remove', 'post_clear'):
+        changed, delta = instance.__dict__.pop('_removed_follow_ids', set()), -1
+        if pk_set is not None:
+            # BulkUnfollowView reports only the edges its DELETE actually removed
+            changed = changed & set(pk_set)
+    else:
+        return
+    if not changed:
+        return
+
+    # reverse=True means the change went through `following` (instance is the follower)
+    if reverse:
+        follower_ids, followee_ids = [instance.id], changed
+    else:
+        follower_ids, followee_ids = changed, [instance.id]
+
+    # Drop the cached adjacency now, and again once the write is visible to other requests
+    graph.invalidate(follower_ids, followee_ids)
+    transaction.on_commit(lambda: graph.invalidate(follower_ids, followee_ids))
+
+    # Clamp at zero so a drifted counter can never trip the CHECK constraint
+    CustomUser.objects.filter(id__in=followee_ids).update(
+        followers_count=Greatest(F('followers_count') + delta * len(follower_ids), 0))
+    CustomUser.objects.filter(id__in=follower_ids).update(
+        following_count=Greatest(F('following_count') + delta * len(followee_ids), 0))
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_new_user_graph(sender, instance, created, **kwargs):
+    """A new user must not inherit adjacency cached under a reused id"""
+    if created:
+        graph.invalidate_user(instance.id)
+
+
+@receiver(post_delete, sender=CustomUser)
+def invalidate_deleted_user_graph(sender, instance, **kwargs):
+    # The cascade deletes follow rows without sending m2m_changed
+    graph.invalidate_user(instance.id)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_cached_tokens(sender, instance, created, update_fields=None, **kwargs):
+    """Password changes, deactivation and profile edits must not be served from the token cache"""
+    # Every login saves last_login alone; a stale last_login in the cache is harmless
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    invalidate_user_tokens(instance.id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    # Logout, token rotation, and the cascade when a user is deleted
+    invalidate_token(instance.key, instance.user_id)
+
+
+@receiver(post_save, sender=CustomUser)
+def render_profile_picture(sender, instance, update_fields=None, **kwargs):
+    """Queue renditions whenever a new profile picture is saved"""
+    if update_fields is not None and 'profile_picture' not in update_fields:
+        return
+    renditions = instance.profile_picture_renditions or {}
+    if instance.profile_picture and renditions.get('source') != instance.profile_picture.name:
+        schedule_renditions(instance)
@@ -1,14 +1,38 @@
-from django.test import TestCase
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from .models import Notification
-from .models import Like  
-from accounts.models import CustomUser
+from notifications.models import Notification
+from posts.models import Like
+from accounts.models import CustomUser, FollowSuggestion
+from accounts.views import BulkFollowView
+from accounts.recommendations import compute_suggestions
+from accounts import graph
+from accounts.thumbnails import generate_renditions
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from posts.models import Post, TimelineEntry
+from accounts.authentication import CachedTokenAuthentication, local_tokens, user_token_cache_key
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from django.test import RequestFactory
+from django.core.management import call_command
+from django.conf import settings
+import io
+import os
+import tempfile
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.models import Session
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 User = get_user_model()
 
 class NotificationTests(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.other_user = User.objects.create_user(username='otheruser', password='testpass')
         self.client.force_authenticate(user=self.user)
@@ -24,7 +48,7 @@ class NotificationTests(APITestCase):
         url = '/api/notifications/'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
     
     def test_unread_count(self):
         # Create unread notifications
@@ -42,4 +66,406 @@ class NotificationTests(APITestCase):
         url = '/api/notifications/unread-count/'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data['unread_count'], 2)
\ No newline at end of file
+        self.assertEqual(response.data['unread_count'], 2)
+
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        graph.adjacency.clear()
+        self.alice, self.bob, self.carol, self.dave = [
+            User.objects.create_user(username=name, password='testpass')
+            for name in ('alice', 'bob', 'carol', 'dave')
+        ]
+        self.alice.follow(self.carol)
+        self.alice.follow(self.dave)
+        self.bob.follow(self.carol)
+        self.dave.follow(self.bob)
+    
+    def test_lookups_are_served_from_cache(self):
+        self.assertTrue(graph.is_following(self.alice.id, self.carol.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.alice.is_following(self.dave))
+            self.assertFalse(self.alice.is_following(self.bob))
+            self.assertEqual(graph.are_following(self.alice.id, [self.bob.id, self.carol.id]),
+                             {self.bob.id: False, self.carol.id: True})
+    
+    def test_follow_and_unfollow_invalidate(self):
+        self.assertFalse(graph.is_following(self.alice.id, self.bob.id))
+        self.assertEqual(list(graph.follower_ids(self.bob.id)), [self.dave.id])
+        self.alice.follow(self.bob)
+        self.assertTrue(graph.is_following(self.alice.id, self.bob.id))
+        self.assertEqual(list(graph.follower_ids(self.bob.id)), sorted([self.alice.id, self.dave.id]))
+        self.alice.unfollow(self.bob)
+        self.assertFalse(graph.is_following(self.alice.id, self.bob.id))
+    
+    def test_intersections(self):
+        self.assertEqual(graph.common_following(self.alice.id, self.bob.id), [self.carol.id])
+        self.assertEqual(graph.followers_you_follow(self.alice.id, self.bob.id), [self.dave.id])
+    
+    @override_settings(FOLLOW_GRAPH_CACHE_SIZE=2)
+    def test_cache_is_bounded(self):
+        for user in (self.alice, self.bob, self.carol):
+            graph.following_ids(user.id)
+        self.assertEqual(len(graph.adjacency), 2)
+    
+    def test_follow_view_rejects_duplicates(self):
+        self.client.force_login(self.alice)
+        response = self.client.post(f'/api/auth/follow/{self.carol.id}/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FollowListSerializerTests(TestCase):
+    def setUp(self):
+        graph.adjacency.clear()
+        self.user = User.objects.create_user(username='viewer', password='testpass')
+        self.followers = [User.objects.create_user(username=f'fan{i}', password='testpass') for i in range(20)]
+        for fan in self.followers:
+            fan.follow(self.user)
+        for fan in self.followers[:5]:
+            self.user.follow(fan)
+        self.client.force_login(self.user)
+    
+    def test_follow_state_is_resolved_in_one_query(self):
+        graph.adjacency.clear()
+        # session + user, the follower page, and one IN query for follow state
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/auth/followers/?page_size=50')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual(sum(user['is_following'] for user in results), 5)
+        self.assertTrue(all(user['following_count'] == 1 for user in results))
+
+    
+    def test_followers_are_cursor_paginated(self):
+        seen = []
+        url = f'/api/auth/users/{self.user.id}/followers/?page_size=8'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 8)
+            seen += [user['username'] for user in response.data['results']]
+            url = response.data['next']
+        # Newest follow first, every follower exactly once
+        self.assertEqual(seen, [fan.username for fan in reversed(self.followers)])
+    
+    def test_following_of_another_user(self):
+        response = self.client.get(f'/api/auth/users/{self.followers[0].id}/following/')
+        self.assertEqual([user['username'] for user in response.data['results']], ['viewer'])
+        response = self.client.get('/api/auth/users/999999/following/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_streaming_export(self):
+        response = self.client.get('/api/auth/followers/?export=true')
+        self.assertTrue(response.streaming)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(set(rows[0]), {'id', 'username', 'profile_picture', 'followers_count', 'following_count'})
+
+
+class FollowSuggestionTests(TestCase):
+    def setUp(self):
+        graph.adjacency.clear()
+        self.users = {name: User.objects.create_user(username=name, password='testpass')
+                      for name in ('ann', 'ben', 'cat', 'dan', 'eve')}
+        ann, ben, cat, dan, eve = self.users.values()
+        ann.follow(ben)
+        ann.follow(cat)
+        ben.follow(dan)
+        cat.follow(dan)
+        cat.follow(eve)
+        ben.follow(ann)
+    
+    def suggestions(self, name):
+        rows = FollowSuggestion.objects.filter(user=self.users[name]).order_by('rank')
+        return [(row.suggested.username, row.mutual_count) for row in rows]
+    
+    def test_friends_of_friends_are_ranked_by_mutual_count(self):
+        written = compute_suggestions(top_k=5, shard_size=2)
+        self.assertEqual(self.suggestions('ann'), [('dan', 2), ('eve', 1)])
+        # ben follows ann, who follows cat; ben already follows dan
+        self.assertEqual(self.suggestions('ben'), [('cat', 1)])
+        self.assertEqual(written, FollowSuggestion.objects.count())
+    
+    def test_rerun_replaces_rows_and_top_k_applies(self):
+        compute_suggestions(top_k=5)
+        compute_suggestions(top_k=1)
+        self.assertEqual(self.suggestions('ann'), [('dan', 2)])
+    
+    def test_endpoint_skips_users_followed_since(self):
+        compute_suggestions()
+        self.client.force_login(self.users['ann'])
+        response = self.client.get('/api/auth/suggestions/')
+        self.assertEqual([(u['username'], u['mutual_count']) for u in response.data], [('dan', 2), ('eve', 1)])
+        self.users['ann'].follow(self.users['dan'])
+        response = self.client.get('/api/auth/suggestions/')
+        self.assertEqual([u['username'] for u in response.data], ['eve'])
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        local_tokens.clear()
+        self.user = User.objects.create_user(username='tokenuser', password='testpass')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+    
+    def authenticate(self):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return CachedTokenAuthentication().authenticate(Request(request))
+    
+    def test_repeat_lookups_skip_the_database(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user, auth = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(auth.key, self.token.key)
+    
+    def test_volatile_columns_are_read_fresh(self):
+        self.authenticate()
+        CustomUser.objects.filter(pk=self.user.pk).update(followers_count=7)
+        user, _ = self.authenticate()
+        self.assertEqual(user.followers_count, 7)
+    
+    def test_deactivation_and_password_change_invalidate(self):
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_200_OK)
+        self.user.set_password('newpass')
+        self.user.save()
+        self.assertEqual(len(local_tokens), 0)
+        
+        self.client.get('/api/auth/profile/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_logout_revokes_token(self):
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_200_OK)
+        response = self.client.post('/api/auth/logout/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    @override_settings(TOKEN_AUTH_SHARED_CACHE=True)
+    def test_shared_tier_warms_other_processes(self):
+        cache.clear()
+        self.authenticate()
+        local_tokens.clear()  # as if this were a fresh process
+        with self.assertNumQueries(0):
+            self.authenticate()
+        Token.objects.filter(key=self.token.key).delete()
+        self.assertIsNone(cache.get(f'auth:token:{self.token.key}'))
+
+
+class LoginTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.user = User.objects.create_user(username='loginuser', password='testpass')
+    
+    def login(self, **extra):
+        return self.client.post('/api/auth/login/', {'username': 'loginuser', 'password': 'testpass', **extra},
+                                format='json')
+    
+    def test_token_only_login_skips_session(self):
+        response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Session.objects.exists())
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+        
+        self.login(session=True)
+        self.assertEqual(Session.objects.count(), 1)
+    
+    @override_settings(TOKEN_AUTH_SHARED_CACHE=True)
+    def test_repeat_login_reuses_cached_token(self):
+        key = self.login().data['token']
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.login().data['token'], key)
+        self.assertFalse([q for q in ctx.captured_queries if 'authtoken_token' in q['sql']])
+        
+        # The key -> user entry was filled at login
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/auth/profile/')
+        self.assertFalse([q for q in ctx.captured_queries if 'authtoken_token' in q['sql']])
+    
+    def test_login_reads_token_from_database_without_shared_cache(self):
+        key = self.login().data['token']
+        # Logout ran in another process, so this process's cache still maps the user to the old key
+        Token.objects.filter(key=key).delete()
+        cache.set(user_token_cache_key(self.user.id), key)
+        self.assertNotEqual(self.login().data['token'], key)
+    
+    def test_login_after_logout_issues_new_token(self):
+        key = self.login().data['token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        self.client.post('/api/auth/logout/')
+        self.client.credentials()
+        self.assertNotEqual(self.login().data['token'], key)
+    
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_hasher_work_factor_is_configurable(self):
+        self.assertTrue(make_password('secret').startswith('pbkdf2_sha256$1000$'))
+        # Existing hashes still verify, and are re-hashed at the new work factor
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+
+class ImportUsersTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        User.objects.create_user(username='existing', password='testpass')
+    
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as handle:
+            handle.write(content)
+        return path
+    
+    def run_import(self, path, **options):
+        call_command('import_users', path, workers=1, stdout=io.StringIO(), **options)
+    
+    def test_csv_import_creates_users_and_tokens(self):
+        path = self.write('users.csv', 'username,email,password,bio\n'
+                                       'ana,ANA@Example.com,secret1,Hi\n'
+                                       'existing,x@example.com,secret2,\n'
+                                       'bo,,,\n'
+                                       'ana,dupe@example.com,secret3,\n')
+        self.run_import(path, batch_size=2)
+        ana = User.objects.get(username='ana')
+        self.assertTrue(ana.check_password('secret1'))
+        self.assertEqual(ana.email, 'ANA@example.com')
+        self.assertFalse(User.objects.get(username='bo').has_usable_password())
+        self.assertEqual(Token.objects.filter(user__username__in=['ana', 'bo']).count(), 2)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+    
+    def test_jsonl_import_resumes_from_checkpoint(self):
+        lines = [json.dumps({'username': f'user{i}', 'password': 'pw'}) for i in range(5)]
+        path = self.write('users.jsonl', '\n'.join(lines) + '\n')
+        # A previous run committed the first three rows before stopping
+        self.write('users.jsonl.checkpoint', '3')
+        self.run_import(path)
+        self.assertEqual(sorted(User.objects.filter(username__startswith='user').values_list('username', flat=True)),
+                         ['user3', 'user4'])
+    
+    def test_empty_file_imports_nothing(self):
+        for name, content in (('empty.csv', 'username,email,password,bio\n'), ('empty.jsonl', '')):
+            with self.subTest(name=name):
+                out = io.StringIO()
+                call_command('import_users', self.write(name, content), workers=1, stdout=out)
+                self.assertIn('Imported 0 users', out.getvalue())
+
+
+@override_settings(NOTIFICATIONS_ASYNC=False)
+class BulkFollowTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        graph.adjacency.clear()
+        self.user = User.objects.create_user(username='syncer', password='testpass')
+        self.contacts = [User.objects.create_user(username=f'contact{i}', password='testpass') for i in range(4)]
+        self.user.follow(self.contacts[0])
+        Post.objects.create(author=self.contacts[1], title='Hello', content='Body')
+        self.client.force_authenticate(user=self.user)
+    
+    def test_bulk_follow_reports_per_id_results(self):
+        ids = [c.id for c in self.contacts] + [self.user.id, 999999, self.contacts[1].id]
+        response = self.client.post('/api/auth/follow/bulk/', {'user_ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['result'] for r in response.data['results']],
+                         ['already_following', 'followed', 'followed', 'followed', 'self', 'not_found'])
+        
+        # Counters, the adjacency cache, timelines and notifications all follow the new edges
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 4)
+        self.assertTrue(self.user.is_following(self.contacts[3]))
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user, post__author=self.contacts[1]).exists())
+        self.assertEqual(Notification.objects.filter(actor=self.user, verb="started following you").count(), 3)
+    
+    def test_bulk_unfollow(self):
+        self.user.follow(self.contacts[1])
+        ids = [self.contacts[0].id, self.contacts[1].id, self.contacts[2].id]
+        response = self.client.post('/api/auth/unfollow/bulk/', {'user_ids': ids}, format='json')
+        self.assertEqual([r['result'] for r in response.data['results']], ['unfollowed', 'unfollowed', 'not_following'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 0)
+        self.assertFalse(self.user.is_following(self.contacts[0]))
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.user).exists())
+    
+    # Notifications are written after commit, off the request path
+    @override_settings(NOTIFICATIONS_ASYNC=True)
+    def test_query_count_does_not_grow_with_the_id_list(self):
+        def follow_all(contacts):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post('/api/auth/follow/bulk/', {'user_ids': [c.id for c in contacts]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(ctx.captured_queries)
+        
+        few = [User.objects.create_user(username=f'few{i}', password='testpass') for i in range(2)]
+        many = [User.objects.create_user(username=f'many{i}', password='testpass') for i in range(20)]
+        for author in few + many:
+            Post.objects.create(author=author, title='Hello', content='Body')
+        self.assertEqual(follow_all(few), follow_all(many))
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.user, post__author__in=many).count(), 20)
+    
+    def test_edges_written_concurrently_are_not_counted_twice(self):
+        # Another request inserts one of the edges after this one checked for it
+        CustomUser.followers.through.objects.create(from_customuser=self.contacts[1], to_customuser=self.user)
+        view = BulkFollowView()
+        written = view.apply(self.user, {self.contacts[1].id, self.contacts[2].id})
+        self.assertEqual(written, {self.contacts[2].id})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 2)
+        
+        view.follow = False
+        CustomUser.followers.through.objects.filter(from_customuser=self.contacts[2], to_customuser=self.user).delete()
+        self.assertEqual(view.apply(self.user, {self.contacts[0].id, self.contacts[2].id}), {self.contacts[0].id})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 1)
+    
+    def test_id_limit(self):
+        response = self.client.post('/api/auth/follow/bulk/', {'user_ids': list(range(1, 502))}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(THUMBNAILS_ASYNC=False)
+class ProfilePictureRenditionTests(APITestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.user = User.objects.create_user(username='pictured', password='testpass')
+        self.client.force_authenticate(user=self.user)
+    
+    def upload(self, color='red'):
+        output = io.BytesIO()
+        Image.new('RGB', (800, 600), color).save(output, 'PNG')
+        picture = SimpleUploadedFile('me.png', output.getvalue(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put('/api/auth/profile/', {'profile_picture': picture}, format='multipart')
+    
+    def test_upload_renders_hashed_renditions(self):
+        self.assertEqual(self.upload().status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        renditions = self.user.profile_picture_renditions
+        self.assertEqual(renditions['source'], self.user.profile_picture.name)
+        with Image.open(os.path.join(settings.MEDIA_ROOT, renditions['small']['webp'])) as small:
+            self.assertEqual((small.format, small.size), ('WEBP', (64, 64)))
+        with Image.open(os.path.join(settings.MEDIA_ROOT, renditions['medium']['jpeg'])) as medium:
+            self.assertEqual((medium.format, medium.size), ('JPEG', (256, 256)))
+        
+        # Identical output maps to the identical content-hashed file
+        self.assertEqual(generate_renditions(self.user.id, renditions['source'])['small'], renditions['small'])
+    
+    def test_serializers_return_rendition_urls(self):
+        response = self.client.get('/api/auth/profile/follow-info/')
+        self.assertIsNone(response.data['profile_picture_renditions'])
+        self.upload()
+        self.user.refresh_from_db()  # force_authenticate keeps serving the in-memory instance
+        response = self.client.get('/api/auth/profile/follow-info/')
+        urls = response.data['profile_picture_renditions']
+        self.assertTrue(urls['small']['webp'].startswith('http://testserver/media/profile_pics/renditions/'))
+        
+        fan = User.objects.create_user(username='fan', password='testpass')
+        fan.follow(self.user)
+        self.client.force_authenticate(user=fan)
+        response = self.client.get('/api/auth/following/')
+        self.assertEqual(response.data['results'][0]['profile_picture_renditions'], urls)
@@ -0,0 +1,136 @@
+"""
+Profile picture renditions.
+
+When a user uploads a profile picture, square renditions are rendered
+with Pillow for every size in THUMBNAIL_SIZES, in WebP and JPEG. This
+runs on a background thread pool once the upload's transaction commits
+(inline with THUMBNAILS_ASYNC = False).
+
+Files are named after a hash of their content, so they can be cached
+forever and are never rewritten. Their names are recorded in
+CustomUser.profile_picture_renditions:
+
+    {"source": "profile_pics/me.png",
+     "small": {"webp": "...", "jpeg": "..."}, "medium": {...}}
+"""
+import atexit
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .authentication import invalidate_user_tokens
+from .models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = 'profile_pics/renditions'
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpeg': ('JPEG', {'quality': 85, 'optimize': True})}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_sizes():
+    return getattr(settings, 'THUMBNAIL_SIZES', {'small': 64, 'medium': 256})
+
+
+def render(source, sizes):
+    """{size_name: {format: bytes}} for an open image file"""
+    image = Image.open(source)
+    # Let the JPEG decoder downscale while reading instead of decoding every pixel
+    largest = max(sizes.values())
+    image.draft('RGB', (largest * 2, largest * 2))
+    image = ImageOps.exif_transpose(image)
+
+    renditions = {}
+    for name, size in sizes.items():
+        square = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        renditions[name] = {}
+        for extension, (image_format, options) in FORMATS.items():
+            output = io.BytesIO()
+            frame = square if image_format == 'WEBP' else square.convert('RGB')
+            frame.save(output, image_format, **options)
+            renditions[name][extension] = output.getvalue()
+    return renditions
+
+
+def store(content, size_name, extension):
+    digest = hashlib.sha256(content).hexdigest()[:20]
+    name = f'{RENDITION_DIR}/{digest}_{size_name}.{extension}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def generate_renditions(user_id, source_name):
+    """Render, store and record the renditions of one uploaded picture"""
+    try:
+        with default_storage.open(source_name) as source:
+            rendered = render(source, get_sizes())
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning("Could not render profile picture %s", source_name, exc_info=True)
+        return None
+
+    renditions = {'source': source_name}
+    for size_name, formats in rendered.items():
+        renditions[size_name] = {ext: store(content, size_name, ext) for ext, content in formats.items()}
+
+    # Skip the write if another picture was uploaded in the meantime
+    updated = CustomUser.objects.filter(id=user_id, profile_picture=source_name).update(
+        profile_picture_renditions=renditions)
+    if updated:
+        # The token cache holds user rows, including this column
+        invalidate_user_tokens(user_id)
+    return renditions
+
+
+def _generate_in_background(user_id, source_name):
+    close_old_connections()
+    try:
+        generate_renditions(user_id, source_name)
+    except Exception:
+        logger.exception("Profile picture rendition failed for user %s", user_id)
+    finally:
+        close_old_connections()
+
+
+def _shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+
+
+def schedule_renditions(user):
+    """Queue rendition generation for the user's current picture after commit"""
+    global _executor
+    user_id, source_name = user.id, user.profile_picture.name
+    if not getattr(settings, 'THUMBNAILS_ASYNC', True):
+        transaction.on_commit(lambda: generate_renditions(user_id, source_name))
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'THUMBNAILS_WORKERS', 2),
+                                           thread_name_prefix='thumbnails')
+    transaction.on_commit(lambda: _executor.submit(_generate_in_background, user_id, source_name))
+
+
+def rendition_urls(user, build_url=None):
+    """{size_name: {format: url}} for the user's current picture, or None if not rendered yet"""
+    renditions = user.profile_picture_renditions or {}
+    if not user.profile_picture or renditions.get('source') != user.profile_picture.name:
+        return None
+    build_url = build_url or (lambda url: url)
+    return {
+        size_name: {ext: build_url(default_storage.url(name)) for ext, name in formats.items()}
+        for size_name, formats in renditions.items() if size_name != 'source'
+    }
+
+
+atexit.register(_shutdown)
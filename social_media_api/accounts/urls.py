@@ -1,17 +1,24 @@
 from django.urls import path
 from .views import (
-    register_user, login_user, user_profile, 
-    get_followers, get_following, user_profile_with_follow_info,
-    FollowUserView, UnfollowUserView
+    register_user, login_user, logout_user, user_profile, 
+    user_profile_with_follow_info,
+    FollowUserView, UnfollowUserView, FollowersView, FollowingView,
+    FollowSuggestionsView, BulkFollowView, BulkUnfollowView,
 )
 
 urlpatterns = [
     path('register/', register_user, name='register'),
     path('login/', login_user, name='login'),
+    path('logout/', logout_user, name='logout'),
     path('profile/', user_profile, name='profile'),
     path('profile/follow-info/', user_profile_with_follow_info, name='profile-follow-info'),
     path('follow/<int:user_id>/', FollowUserView.as_view(), name='follow-user'),  
     path('unfollow/<int:user_id>/', UnfollowUserView.as_view(), name='unfollow-user'),  
-    path('followers/', get_followers, name='followers'),
-    path('following/', get_following, name='following'),
+    path('follow/bulk/', BulkFollowView.as_view(), name='bulk-follow'),
+    path('unfollow/bulk/', BulkUnfollowView.as_view(), name='bulk-unfollow'),
+    path('followers/', FollowersView.as_view(), name='followers'),
+    path('following/', FollowingView.as_view(), name='following'),
+    path('users/<int:user_id>/followers/', FollowersView.as_view(), name='user-followers'),
+    path('users/<int:user_id>/following/', FollowingView.as_view(), name='user-following'),
+    path('suggestions/', FollowSuggestionsView.as_view(), name='follow-suggestions'),
 ]
\ No newline at end of file
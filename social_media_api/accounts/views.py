@@ -1,22 +1,38 @@
+import json
+
 from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated  
 from rest_framework.authtoken.models import Token
-from django.contrib.auth import login
+from django.conf import settings
+from django.contrib.auth import login, logout
+from django.contrib.auth.signals import user_logged_in
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import m2m_changed
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-from notifications.models import Notification
+from notifications.dispatch import notify, notify_many
 from .serializers import (
     UserRegistrationSerializer, 
     UserLoginSerializer, 
     UserProfileSerializer,
-    UserFollowSerializer
+    UserFollowSerializer,
+    FollowSuggestionSerializer,
+    BulkFollowSerializer,
 )
-from .models import CustomUser
+from . import graph
+from .models import CustomUser, FollowSuggestion
+from .pagination import IdKeysetPagination
 
 User = get_user_model()
 
+EXPORT_CHUNK_SIZE = 2000
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def register_user(request):
@@ -38,7 +54,14 @@ def login_user(request):
     if serializer.is_valid():
         user = serializer.validated_data['user']
         token = serializer.validated_data['token']
-        login(request, user)
+        session = serializer.validated_data.get('session')
+        if session is None:
+            session = settings.LOGIN_CREATES_SESSION
+        if session:
+            login(request, user)
+        else:
+            # Token-only: skip the session row but keep last_login and other receivers working
+            user_logged_in.send(sender=user.__class__, request=request, user=user)
         return Response({
             'token': token,
             'user_id': user.id,
@@ -46,6 +69,15 @@ def login_user(request):
         }, status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout_user(request):
+    """Revoke the token used for this request and end any session"""
+    if isinstance(request.auth, Token):
+        request.auth.delete()
+    logout(request)
+    return Response({'message': 'Logged out.'}, status=status.HTTP_200_OK)
+
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])  
 def user_profile(request):
@@ -72,31 +104,12 @@ class FollowUserView(generics.GenericAPIView):
         if request.user == user_to_follow:
             return Response({"error": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
         
-        if request.user.following.filter(id=user_to_follow.id).exists():
-            return Response({"error": "You are already following this user."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if request.user.follow(user_to_follow):
-            return Response({"message": f"You are now following {user_to_follow.username}."}, status=status.HTTP_200_OK)
-        
-        return Response({"error": "Unable to follow user."}, status=status.HTTP_400_BAD_REQUEST)
-    
-    
-    def post(self, request, *args, **kwargs):
-        user_to_follow = self.get_object()
-        
-        if request.user == user_to_follow:
-            return Response({"error": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if request.user.following.filter(id=user_to_follow.id).exists():
+        if request.user.is_following(user_to_follow):
             return Response({"error": "You are already following this user."}, status=status.HTTP_400_BAD_REQUEST)
         
         if request.user.follow(user_to_follow):
             # Create notification for the user being followed
-            Notification.objects.create(
-                recipient=user_to_follow,
-                actor=request.user,
-                verb="started following you"
-            )
+            notify(user_to_follow, request.user, "started following you")
             
             return Response({"message": f"You are now following {user_to_follow.username}."}, status=status.HTTP_200_OK)
         
@@ -110,7 +123,7 @@ class UnfollowUserView(generics.GenericAPIView):
     def post(self, request, *args, **kwargs):
         user_to_unfollow = self.get_object()
         
-        if not request.user.following.filter(id=user_to_unfollow.id).exists():
+        if not request.user.is_following(user_to_unfollow):
             return Response({"error": "You are not following this user."}, status=status.HTTP_400_BAD_REQUEST)
         
         if request.user.unfollow(user_to_unfollow):
@@ -126,7 +139,7 @@ class UnfollowUserView(generics.GenericAPIView):
     def post(self, request, *args, **kwargs):
         user_to_unfollow = self.get_object()
         
-        if not request.user.following.filter(id=user_to_unfollow.id).exists():
+        if not request.user.is_following(user_to_unfollow):
             return Response({"error": "You are not following this user."}, status=status.HTTP_400_BAD_REQUEST)
         
         if request.user.unfollow(user_to_unfollow):
@@ -135,21 +148,161 @@ class UnfollowUserView(generics.GenericAPIView):
         return Response({"error": "Unable to unfollow user."}, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])  
-def get_followers(request):
-    """Get list of followers"""
-    followers = request.user.followers.all()
-    serializer = UserFollowSerializer(followers, many=True)
-    return Response(serializer.data)
+class BulkFollowView(APIView):
+    """
+    Follow many users at once: {"user_ids": [...]}.
+    Returns one result per id: followed, already_following, not_found or self.
+    """
+    permission_classes = [IsAuthenticated]
+    follow = True
+    
+    def post(self, request, *args, **kwargs):
+        serializer = BulkFollowSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = list(dict.fromkeys(serializer.validated_data['user_ids']))
+        
+        # Which ids exist, and which of them the requester already follows, in one query
+        Follow = CustomUser.followers.through
+        edge = Follow.objects.filter(to_customuser_id=request.user.id, from_customuser_id=OuterRef('pk'))
+        users = {user.id: user for user in
+                 CustomUser.objects.filter(id__in=user_ids).annotate(followed=Exists(edge))}
+        
+        if self.follow:
+            changed = [users[pk] for pk in user_ids if pk in users and pk != request.user.id and not users[pk].followed]
+        else:
+            changed = [users[pk] for pk in user_ids if pk in users and users[pk].followed]
+        changed_ids = {user.id for user in changed}
+        
+        if changed:
+            with transaction.atomic():
+                # A concurrent request may have written some of the same edges already
+                changed_ids = self.apply(request.user, changed_ids)
+            if self.follow and changed_ids:
+                notify_many([user for user in changed if user.id in changed_ids], request.user, "started following you")
+        
+        results = [{'id': pk, 'result': self.result(request.user, pk, users, changed_ids)} for pk in user_ids]
+        return Response({'results': results}, status=status.HTTP_200_OK)
+    
+    def apply(self, user, changed_ids):
+        """
+        Write the edges, then send m2m_changed so counters, caches and
+        timelines follow. Returns the ids whose edge this request actually
+        inserted or deleted; only those reach post_add/post_remove.
+        """
+        Follow = CustomUser.followers.through
+        signal_kwargs = dict(sender=Follow, instance=user, reverse=True, model=CustomUser, using=Follow.objects.db)
+        table = connection.ops.quote_name(Follow._meta.db_table)
+        ids = sorted(changed_ids)
+        with connection.cursor() as cursor:
+            if self.follow:
+                m2m_changed.send(action='pre_add', pk_set=changed_ids, **signal_kwargs)
+                cursor.execute(
+                    f'INSERT INTO {table} (from_customuser_id, to_customuser_id) '
+                    f'VALUES {", ".join(["(%s, %s)"] * len(ids))} '
+                    f'ON CONFLICT (from_customuser_id, to_customuser_id) DO NOTHING RETURNING from_customuser_id',
+                    [value for pk in ids for value in (pk, user.id)],
+                )
+            else:
+                m2m_changed.send(action='pre_remove', pk_set=changed_ids, **signal_kwargs)
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE to_customuser_id = %s '
+                    f'AND from_customuser_id IN ({", ".join(["%s"] * len(ids))}) RETURNING from_customuser_id',
+                    [user.id, *ids],
+                )
+            written = {row[0] for row in cursor.fetchall()}
+        if written:
+            m2m_changed.send(action='post_add' if self.follow else 'post_remove', pk_set=written, **signal_kwargs)
+        return written
+    
+    def result(self, user, pk, users, changed_ids):
+        if pk not in users:
+            return 'not_found'
+        if pk == user.id:
+            return 'self'
+        if pk in changed_ids:
+            return 'followed' if self.follow else 'unfollowed'
+        return 'already_following' if self.follow else 'not_following'
+
+
+class BulkUnfollowView(BulkFollowView):
+    """Unfollow many users at once; results are unfollowed, not_following or not_found"""
+    follow = False
+
+
+class FollowersView(generics.GenericAPIView):
+    """
+    Followers of a user (the requester unless user_id is given), newest first.
+    ?export=true streams every row as one JSON array instead of paging.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = IdKeysetPagination
+    # Through rows (from_customuser=X, to_customuser=Y) mean Y follows X
+    edge_filter = 'from_customuser_id'
+    user_field = 'to_customuser'
+    export_fields = ('id', 'username', 'profile_picture', 'followers_count', 'following_count')
+    
+    def get_user_id(self):
+        user_id = self.kwargs.get('user_id')
+        if user_id is None:
+            return self.request.user.id
+        if not User.objects.filter(id=user_id).exists():
+            raise Http404
+        return user_id
+    
+    def get_queryset(self):
+        edges = CustomUser.followers.through.objects.filter(**{self.edge_filter: self.get_user_id()})
+        # Only the columns UserFollowSerializer reads
+        return edges.select_related(self.user_field).only(
+            'id', *(f'{self.user_field}__{field}' for field in self.export_fields + ('profile_picture_renditions',)))
+    
+    def get(self, request, *args, **kwargs):
+        if request.query_params.get('export', '').lower() in ('1', 'true', 'yes'):
+            return self.export()
+        edges = self.paginate_queryset(self.get_queryset())
+        users = [getattr(edge, self.user_field) for edge in edges]
+        serializer = UserFollowSerializer(users, many=True, context={'request': request})
+        return self.get_paginated_response(serializer.data)
+    
+    def export(self):
+        rows = (self.get_queryset().order_by('-id')
+                .values_list(*(f'{self.user_field}__{field}' for field in self.export_fields)))
+        
+        def stream():
+            yield '['
+            for index, row in enumerate(rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)):
+                user = dict(zip(self.export_fields, row))
+                user['profile_picture'] = default_storage.url(user['profile_picture']) if user['profile_picture'] else None
+                yield (',' if index else '') + json.dumps(user)
+            yield ']'
+        
+        return StreamingHttpResponse(stream(), content_type='application/json')
+
+
+class FollowingView(FollowersView):
+    """Users followed by a user, newest first"""
+    edge_filter = 'to_customuser_id'
+    user_field = 'from_customuser'
+
+class FollowSuggestionsView(generics.ListAPIView):
+    """Precomputed "people you may know", most mutual connections first"""
+    permission_classes = [IsAuthenticated]
+    serializer_class = FollowSuggestionSerializer
+    pagination_class = None
+    
+    def get_queryset(self):
+        return (FollowSuggestion.objects.filter(user=self.request.user).order_by('rank')
+                .select_related('suggested')
+                .only('mutual_count', 'suggested__id', 'suggested__username',
+                      'suggested__profile_picture', 'suggested__profile_picture_renditions',
+                      'suggested__followers_count'))
+    
+    def list(self, request, *args, **kwargs):
+        # Suggestions are rebuilt offline; drop anyone followed since the last run
+        suggestions = list(self.get_queryset())
+        following = graph.are_following(request.user.id, [s.suggested_id for s in suggestions])
+        suggestions = [s for s in suggestions if not following[s.suggested_id]]
+        return Response(self.get_serializer(suggestions, many=True).data)
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])  
-def get_following(request):
-    """Get list of users being followed"""
-    following = request.user.following.all()
-    serializer = UserFollowSerializer(following, many=True)
-    return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])  
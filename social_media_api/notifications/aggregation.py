@@ -0,0 +1,116 @@
+"""
+Notification coalescing.
+
+Notifications that share a recipient, verb and target and arrive within
+NOTIFICATIONS_COALESCE_WINDOW seconds of each other are merged into one
+unread row ("alice and 42 others liked your post"). The row keeps the total
+number of distinct actors plus a short sample of the most recent ones.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification, NOT_MARKED_READ
+
+
+def get_window():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATIONS_COALESCE_WINDOW', 3600))
+
+
+def get_sample_size():
+    return getattr(settings, 'NOTIFICATIONS_ACTOR_SAMPLE_SIZE', 3)
+
+
+def coalesce_key(notification):
+    return (notification.recipient_id, notification.verb,
+            notification.target_content_type_id, notification.target_object_id)
+
+
+def absorb(aggregate, notification):
+    """Fold one more event into an aggregate row, in memory"""
+    sample = [actor for actor in aggregate.recent_actors if actor['id'] != notification.actor_id]
+    if len(sample) == len(aggregate.recent_actors):
+        # Only the sample is tracked, so repeat actors older than it are counted again
+        aggregate.actor_count += 1
+    aggregate.recent_actors = [
+        {'id': notification.actor_id, 'username': notification.actor.username}
+    ] + sample[:get_sample_size() - 1]
+    aggregate.actor = notification.actor
+
+
+def aggregate_key(recipient_id, verb, content_type_id, object_id):
+    """Value of Notification.aggregate_key for the open aggregate of one coalesce key"""
+    return f'{recipient_id}:{content_type_id or ""}:{object_id or ""}:{verb}'
+
+
+def write_coalesced(notifications):
+    """
+    Write a batch of unsaved notifications, merging them into existing
+    aggregates where possible. Returns (created, updated) rows.
+
+    Only the open aggregate of a key carries aggregate_key, and the column
+    is unique. So a worker inserts a seed row with ignore_conflicts and
+    re-reads whichever row holds the key. Two workers draining the same
+    key then end up on one row instead of inserting one each.
+    """
+    groups = {}
+    for notification in notifications:
+        groups.setdefault(coalesce_key(notification), []).append(notification)
+
+    now = timezone.now()
+    cutoff = now - get_window()
+    created, updated = [], []
+    for (recipient_id, verb, content_type_id, object_id), group in groups.items():
+        key = aggregate_key(recipient_id, verb, content_type_id, object_id)
+        with transaction.atomic():
+            # Rows at or below the read watermark already count as read: start a new one.
+            # Read it here, not from the recipient object, which is a snapshot from when
+            # the event was queued and may predate the user reading their inbox.
+            watermark = (get_user_model().objects.filter(pk=recipient_id)
+                         .values_list('notifications_read_at', flat=True).first())
+            since = max(cutoff, watermark) if watermark else cutoff
+            # A read or expired aggregate gives up the key so a new row can take it
+            (Notification.objects.filter(aggregate_key=key)
+             .exclude(NOT_MARKED_READ, timestamp__gt=since).update(aggregate_key=None))
+
+            seed = group[0]
+            seed.aggregate_key = key
+            seed.actor_count = 0
+            seed.recent_actors = []
+            Notification.objects.bulk_create([seed], ignore_conflicts=True)
+            aggregate = Notification.objects.select_for_update().get(aggregate_key=key)
+            if aggregate.actor_count == 0:
+                # Our seed won; keep the instance with its actor and target already loaded
+                seed.pk = aggregate.pk
+                aggregate = seed
+                created.append(aggregate)
+            else:
+                # Moving it past the watermark makes a read row unread again; see bump_unread_counters
+                aggregate.reopened = (aggregate.is_read is None and watermark is not None
+                                      and aggregate.timestamp <= watermark)
+                aggregate.timestamp = now
+                updated.append(aggregate)
+
+            for notification in group:
+                absorb(aggregate, notification)
+            Notification.objects.filter(pk=aggregate.pk).update(
+                actor=aggregate.actor,
+                actor_count=aggregate.actor_count,
+                recent_actors=aggregate.recent_actors,
+                timestamp=aggregate.timestamp,
+            )
+    return created, updated
+
+
+def describe(notification):
+    """Human readable summary, e.g. "alice and 2 others liked your post" """
+    names = [actor['username'] for actor in notification.recent_actors] or [notification.actor.username]
+    others = notification.actor_count - 1
+    if others <= 0:
+        return f"{names[0]} {notification.verb}"
+    if others == 1 and len(names) > 1:
+        return f"{names[0]} and {names[1]} {notification.verb}"
+    return f"{names[0]} and {others} others {notification.verb}"
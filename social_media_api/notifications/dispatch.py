@@ -0,0 +1,130 @@
+"""
+Background notification pipeline.
+
+Views call notify() instead of Notification.objects.create(). Once the
+surrounding transaction commits, the notification is put on a bounded
+in-process queue, and a small thread pool drains it into batched
+bulk_create() calls. With NOTIFICATIONS_ASYNC = False everything is
+written inline instead, which keeps tests deterministic.
+"""
+import atexit
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .aggregation import write_coalesced
+from .models import Notification
+from .signals import notifications_created
+
+logger = logging.getLogger(__name__)
+
+
+def write_notifications(notifications):
+    """Persist a batch of unsaved notifications and announce them"""
+    if not notifications:
+        return []
+    created, updated = write_coalesced(notifications)
+    notifications_created.send(sender=Notification, notifications=created, updated=updated)
+    return created
+
+
+class NotificationDispatcher:
+    def __init__(self, queue_size, batch_size, workers):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='notifications')
+                for _ in range(self.workers):
+                    self._executor.submit(self._consume)
+
+    def submit(self, notification):
+        self.start()
+        try:
+            self.queue.put_nowait(notification)
+        except queue.Full:
+            # Apply backpressure rather than dropping the notification
+            logger.warning("Notification queue full, writing inline")
+            write_notifications([notification])
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        # Never read past a shutdown sentinel (None): each worker takes exactly one
+        while batch[-1] is not None and len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _consume(self):
+        while True:
+            batch = self._next_batch()
+            stopping = batch[-1] is None
+            self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch):
+        notifications = [n for n in batch if n is not None]
+        close_old_connections()
+        try:
+            write_notifications(notifications)
+        except Exception:
+            logger.exception("Failed to write %d notifications", len(notifications))
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    def flush(self):
+        """Block until everything queued so far has been written"""
+        if self._executor is not None:
+            self.queue.join()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is None:
+                return
+            for _ in range(self.workers):
+                self.queue.put(None)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+dispatcher = NotificationDispatcher(
+    queue_size=getattr(settings, 'NOTIFICATIONS_QUEUE_SIZE', 10000),
+    batch_size=getattr(settings, 'NOTIFICATIONS_BATCH_SIZE', 500),
+    workers=getattr(settings, 'NOTIFICATIONS_WORKERS', 2),
+)
+atexit.register(dispatcher.shutdown)
+
+
+def notify(recipient, actor, verb, target=None):
+    """Queue a notification to be written after the current transaction commits"""
+    notify_many([recipient], actor, verb, target)
+
+
+def notify_many(recipients, actor, verb, target=None):
+    """Same as notify() for several recipients, handed to the pipeline together"""
+    notifications = [Notification(recipient=recipient, actor=actor, verb=verb, target=target)
+                     for recipient in recipients if recipient != actor]
+    if not notifications:
+        return
+
+    if getattr(settings, 'NOTIFICATIONS_ASYNC', True):
+        def submit():
+            for notification in notifications:
+                dispatcher.submit(notification)
+        transaction.on_commit(submit)
+    else:
+        write_notifications(notifications)
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def unmark_unread(apps, schema_editor):
+    # Unread rows become "unmarked" so the read watermark can apply to them
+    Notification = apps.get_model('notifications', 'Notification')
+    Notification.objects.filter(is_read=False).update(is_read=None)
+
+
+def mark_unread(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    Notification.objects.filter(is_read__isnull=True).update(is_read=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0004_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notif_unread_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notif_unread_target_idx',
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='is_read',
+            field=models.BooleanField(default=None, null=True),
+        ),
+        migrations.RunPython(unmark_unread, mark_unread),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read__isnull', True), ('is_read', False), _connector='OR'), fields=['recipient', '-timestamp'], name='notif_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read__isnull', True), ('is_read', False), _connector='OR'), fields=['recipient', 'verb', 'target_content_type', 'target_object_id'], name='notif_unread_target_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_read_watermark'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notif_unread_target_idx',
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='aggregate_key',
+            field=models.CharField(blank=True, editable=False, max_length=320, null=True, unique=True),
+        ),
+    ]
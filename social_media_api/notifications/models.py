@@ -3,8 +3,29 @@ from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
+# Rows not explicitly marked either way (is_read IS NULL) or explicitly marked unread
+NOT_MARKED_READ = models.Q(is_read__isnull=True) | models.Q(is_read=False)
+
+
+class NotificationQuerySet(models.QuerySet):
+    def unread_for(self, user):
+        """
+        Unread notifications of `user`.
+
+        A row is read if it was marked read explicitly, or if it is not marked
+        either way and is no newer than the user's notifications_read_at
+        watermark. Rows explicitly marked unread stay unread.
+        """
+        unread = models.Q(is_read__isnull=True)
+        if user.notifications_read_at is not None:
+            unread &= models.Q(timestamp__gt=user.notifications_read_at)
+        # NOT_MARKED_READ is implied, but spelling it out lets SQLite match notif_unread_idx
+        return self.filter(recipient=user).filter(NOT_MARKED_READ).filter(unread | models.Q(is_read=False))
+
+
 class Notification(models.Model):
-    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    # Indexed by notif_recipient_ts_idx below, which also covers plain recipient lookups
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications', db_index=False)
     actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='acted_notifications')
     verb = models.CharField(max_length=255)  # e.g., "liked your post", "commented on your post", "started following you"
     
@@ -14,10 +35,32 @@ class Notification(models.Model):
     target = GenericForeignKey('target_content_type', 'target_object_id')
     timestamp = models.DateTimeField(auto_now_add=True)
     
-    is_read = models.BooleanField(default=False)
+    # None: derived from recipient.notifications_read_at; True/False: marked explicitly
+    is_read = models.BooleanField(null=True, default=None)
+    
+    # Aggregation: similar notifications are merged into one row (see notifications.aggregation)
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actors = models.JSONField(default=list, blank=True)  # [{"id": ..., "username": ...}], newest first
+    # Set only on the open aggregate of its recipient/verb/target, so workers cannot create two
+    aggregate_key = models.CharField(max_length=320, null=True, blank=True, unique=True, editable=False)
+    
+    objects = NotificationQuerySet.as_manager()
 
     class Meta:
         ordering = ['-timestamp']  
+        indexes = [
+            # NotificationListView: WHERE recipient = ? ORDER BY timestamp DESC
+            models.Index(fields=['recipient', '-timestamp'], name='notif_recipient_ts_idx'),
+            # Unread lookups: recent rows above the read watermark that were not marked read
+            models.Index(fields=['recipient', '-timestamp'], name='notif_unread_idx',
+                         condition=NOT_MARKED_READ),
+        ]
 
     def __str__(self):
-        return f"{self.actor.username} {self.verb}"
\ No newline at end of file
+        return f"{self.actor.username} {self.verb}"
+    
+    def read_for(self, user):
+        """Effective read state, resolving the watermark for unmarked rows"""
+        if self.is_read is not None:
+            return self.is_read
+        return user.notifications_read_at is not None and self.timestamp <= user.notifications_read_at
\ No newline at end of file
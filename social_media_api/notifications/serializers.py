@@ -1,10 +1,46 @@
+from django.contrib.contenttypes.models import ContentType
 from rest_framework import serializers
+from .aggregation import describe
 from .models import Notification
 
 class NotificationSerializer(serializers.ModelSerializer):
     actor_username = serializers.CharField(source='actor.username', read_only=True)
+    target = serializers.SerializerMethodField()
+    summary = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = Notification
-        fields = ['id', 'actor_username', 'verb', 'target', 'is_read', 'created_at']
-        read_only_fields = ['id', 'actor_username', 'verb', 'target', 'created_at']
\ No newline at end of file
+        fields = ['id', 'actor_username', 'verb', 'target', 'is_read', 'timestamp',
+                  'actor_count', 'recent_actors', 'summary']
+        read_only_fields = ['id', 'actor_username', 'verb', 'target', 'timestamp',
+                            'actor_count', 'recent_actors', 'summary']
+    
+    def get_target(self, obj):
+        # Describe the target without loading it; get_for_id is served from the ContentType cache
+        if obj.target_content_type_id is None:
+            return None
+        content_type = ContentType.objects.get_for_id(obj.target_content_type_id)
+        return {'type': content_type.model, 'id': obj.target_object_id}
+    
+    def get_summary(self, obj):
+        return describe(obj)
+    
+    def get_is_read(self, obj):
+        # Lists are always the requester's own inbox, so avoid loading each recipient
+        request = self.context.get('request')
+        user = request.user if request and request.user.id == obj.recipient_id else obj.recipient
+        return obj.read_for(user)
+
+
+class NotificationIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                max_length=500, required=False)
+    all = serializers.BooleanField(required=False, default=False)
+    
+    def validate(self, data):
+        if data.get('all') and not self.context.get('allow_all'):
+            raise serializers.ValidationError("'all' is only supported when marking read.")
+        if not data.get('all') and not data.get('ids'):
+            raise serializers.ValidationError("Provide a list of 'ids'.")
+        return data
@@ -0,0 +1,38 @@
+from collections import Counter
+
+from django.db.models.signals import post_save
+from django.dispatch import Signal, receiver
+
+from .models import Notification
+from .unread import increment_unread, invalidate_unread
+
+# Sent after a batch has been written, with `notifications=[...]` for new rows
+# and `updated=[...]` for existing aggregates that absorbed more events.
+# bulk_create does not send post_save, so hook into this instead.
+notifications_created = Signal()
+
+
+@receiver(notifications_created)
+def bump_unread_counters(sender, notifications, updated=(), **kwargs):
+    """Write-through: new unread rows bump the recipient's cached counter"""
+    counts = Counter(n.recipient_id for n in notifications if not n.is_read)
+    for user_id, delta in counts.items():
+        increment_unread(user_id, delta)
+    # An aggregate that was read before it absorbed more events is unread again
+    for user_id in {n.recipient_id for n in updated if getattr(n, 'reopened', False)}:
+        invalidate_unread(user_id)
+
+
+@receiver(post_save, sender=Notification)
+def bump_unread_counter(sender, instance, created, **kwargs):
+    """Same as above for rows saved one at a time, e.g. from the admin"""
+    if created and not instance.is_read:
+        increment_unread(instance.recipient_id)
+
+
+@receiver(notifications_created)
+def publish_to_streams(sender, notifications, updated=(), **kwargs):
+    """Push new and re-bumped rows to any open SSE connections"""
+    from .stream import hub  # stream imports the serializers, which import this app's models
+    for notification in list(notifications) + list(updated):
+        hub.publish(notification)
@@ -0,0 +1,121 @@
+"""
+Server-Sent Events stream of notifications.
+
+Served as an async view under ASGI (social_media_api/asgi.py). Each open
+connection subscribes to an in-process hub, and the notification pipeline
+publishes new and updated rows to it. Event ids encode the notification
+timestamp, so a reconnecting client that sends Last-Event-ID is first sent
+everything it missed from the database. The periodic heartbeat does the
+same catch-up, which covers rows written by other processes.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Notification
+from .serializers import NotificationSerializer
+
+CATCH_UP_LIMIT = 100
+
+
+def event_id(notification):
+    """Microseconds since the epoch of the notification's timestamp"""
+    return str(int(notification.timestamp.timestamp() * 1_000_000))
+
+
+def parse_event_id(value):
+    try:
+        return datetime.fromtimestamp(int(value) / 1_000_000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def format_event(notification):
+    """Render one SSE frame; returns (timestamp, frame) so streams can skip repeats"""
+    data = json.dumps(NotificationSerializer(notification).data)
+    return notification.timestamp, f"id: {event_id(notification)}\nevent: notification\ndata: {data}\n\n"
+
+
+class NotificationHub:
+    """Fans notifications out to the stream connections open in this process"""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        subscription = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            self._subscribers[user_id].discard(subscription)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+    def publish(self, notification):
+        """Thread-safe; called from request threads and pipeline workers"""
+        with self._lock:
+            subscriptions = list(self._subscribers.get(notification.recipient_id, ()))
+        if not subscriptions:
+            return
+        # Serialize here, in sync code, so the event loop never touches the ORM
+        event = format_event(notification)
+        for loop, queue in subscriptions:
+            loop.call_soon_threadsafe(self._offer, queue, event)
+
+    @staticmethod
+    def _offer(queue, event):
+        # A slow client misses live events here and picks them up on the next catch-up
+        if not queue.full():
+            queue.put_nowait(event)
+
+
+hub = NotificationHub()
+
+
+def _missed_since(user, since):
+    notifications = (Notification.objects.filter(recipient=user, timestamp__gt=since)
+                     .select_related('actor', 'recipient').order_by('timestamp')[:CATCH_UP_LIMIT])
+    return [format_event(notification) for notification in notifications]
+
+
+async def event_stream(user, last_event_id=None, heartbeat=None):
+    """Yield SSE frames for `user` until the client disconnects"""
+    heartbeat = heartbeat or getattr(settings, 'NOTIFICATIONS_STREAM_HEARTBEAT', 15)
+    subscription = hub.subscribe(user.id)
+    queue = subscription[1]
+    since = parse_event_id(last_event_id)
+    catch_up = since is not None
+    if since is None:
+        since = timezone.now()
+    try:
+        yield f"retry: {heartbeat * 1000}\n\n"
+        while True:
+            if catch_up:
+                for timestamp, frame in await sync_to_async(_missed_since)(user, since):
+                    since = max(since, timestamp)
+                    yield frame
+                catch_up = False
+            try:
+                timestamp, frame = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                # Also pick up rows written by other processes, which never reach this hub
+                catch_up = True
+                yield ": keep-alive\n\n"
+                continue
+            if timestamp > since:
+                since = timestamp
+                yield frame
+    finally:
+        hub.unsubscribe(user.id, subscription)
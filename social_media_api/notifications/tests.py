@@ -1,3 +1,345 @@
-from django.test import TestCase
+import asyncio
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from posts.counters import like_counters
+from posts.models import Post
+from .aggregation import describe
+from .dispatch import NotificationDispatcher, notify
+from .models import Notification
+from .signals import notifications_created
+from .stream import event_id, event_stream
+from .unread import unread_cache_key
+
+User = get_user_model()
+
+
+@override_settings(NOTIFICATIONS_ASYNC=False)
+class NotifyTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='liker', password='testpass')
+        self.author = User.objects.create_user(username='author', password='testpass')
+        self.post = Post.objects.create(author=self.author, title='Post', content='Body')
+        self.client.force_authenticate(user=self.user)
+    
+    def test_like_notifies_author(self):
+        response = self.client.post(reverse('post-like', kwargs={'pk': self.post.pk}))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.actor, self.user)
+        self.assertEqual(notification.target, self.post)
+    
+    def test_follow_notifies_followee(self):
+        response = self.client.post(reverse('follow-user', kwargs={'user_id': self.author.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(Notification.objects.filter(recipient=self.author, verb="started following you").exists())
+    
+    def test_no_notification_for_own_actions(self):
+        notify(self.user, self.user, "liked your post")
+        self.assertFalse(Notification.objects.exists())
+
+
+@override_settings(NOTIFICATIONS_ASYNC=True)
+class AsyncNotifyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='liker', password='testpass')
+        self.author = User.objects.create_user(username='author', password='testpass')
+    
+    def test_notification_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            notify(self.author, self.user, "started following you")
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Notification.objects.exists())
+
+
+class DispatcherTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='liker', password='testpass')
+        self.author = User.objects.create_user(username='author', password='testpass')
+    
+    def test_workers_write_batches(self):
+        dispatcher = NotificationDispatcher(queue_size=100, batch_size=10, workers=2)
+        for i in range(25):
+            dispatcher.submit(Notification(recipient=self.author, actor=self.user, verb=f"event {i}"))
+        dispatcher.flush()
+        dispatcher.shutdown()
+        self.assertEqual(Notification.objects.filter(recipient=self.author).count(), 25)
+    
+    def test_workers_draining_one_key_share_an_aggregate(self):
+        post = Post.objects.create(author=self.author, title='Viral', content='Body')
+        fans = User.objects.bulk_create([User(username=f'fan{i}', password='!') for i in range(40)])
+        # One notification per batch, so every worker keeps looking up the same key
+        dispatcher = NotificationDispatcher(queue_size=100, batch_size=1, workers=4)
+        for fan in fans:
+            dispatcher.submit(Notification(recipient=self.author, actor=fan, verb="liked your post", target=post))
+        dispatcher.flush()
+        dispatcher.shutdown()
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.actor_count, 40)
+    
+    def test_full_queue_writes_inline(self):
+        dispatcher = NotificationDispatcher(queue_size=1, batch_size=10, workers=1)
+        # Keep the workers stopped so the queue stays full
+        with mock.patch.object(dispatcher, 'start'):
+            dispatcher.submit(Notification(recipient=self.author, actor=self.user, verb="queued"))
+            dispatcher.submit(Notification(recipient=self.author, actor=self.user, verb="overflow"))
+        self.assertTrue(Notification.objects.filter(verb="overflow").exists())
+        self.assertFalse(Notification.objects.filter(verb="queued").exists())
+
+
+@override_settings(NOTIFICATIONS_ASYNC=False)
+class AggregationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='testpass')
+        self.fans = [User.objects.create_user(username=f'fan{i}', password='testpass') for i in range(5)]
+        self.post = Post.objects.create(author=self.author, title='Viral', content='Body')
+        self.client.force_authenticate(user=self.author)
+    
+    def like_from(self, *fans):
+        for fan in fans:
+            notify(self.author, fan, "liked your post", target=self.post)
+    
+    def test_likes_on_same_post_are_merged(self):
+        self.like_from(*self.fans)
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.actor_count, 5)
+        self.assertEqual(notification.actor, self.fans[-1])
+        self.assertEqual([a['username'] for a in notification.recent_actors], ['fan4', 'fan3', 'fan2'])
+        
+        response = self.client.get(reverse('unread-notification-count'))
+        self.assertEqual(response.data['unread_count'], 1)
+        response = self.client.get(reverse('notification-list'))
+        self.assertEqual(response.data['results'][0]['summary'], "fan4 and 4 others liked your post")
+    
+    def test_repeat_actor_is_not_double_counted(self):
+        self.like_from(self.fans[0], self.fans[1], self.fans[0])
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(describe(notification), "fan0 and fan1 liked your post")
+    
+    def test_different_targets_and_verbs_stay_separate(self):
+        other_post = Post.objects.create(author=self.author, title='Other', content='Body')
+        self.like_from(self.fans[0])
+        notify(self.author, self.fans[1], "liked your post", target=other_post)
+        notify(self.author, self.fans[2], "commented on your post", target=self.post)
+        self.assertEqual(Notification.objects.filter(recipient=self.author).count(), 3)
+    
+    def test_watermark_is_read_when_the_notification_is_written(self):
+        # The dispatcher writes later, with the recipient as it was when the event was queued
+        queued_author = User.objects.get(pk=self.author.pk)
+        self.like_from(self.fans[0])
+        self.client.get(reverse('notification-list'))
+        
+        notify(queued_author, self.fans[1], "liked your post", target=self.post)
+        latest = Notification.objects.filter(recipient=self.author).first()
+        self.assertEqual((Notification.objects.filter(recipient=self.author).count(), latest.actor_count), (2, 1))
+        self.assertEqual(self.client.get(reverse('unread-notification-count')).data['unread_count'], 1)
+    
+    def test_like_after_listing_the_inbox_starts_a_new_row(self):
+        for write_behind in (False, True):
+            post = Post.objects.create(author=self.author, title=f'Liked {write_behind}', content='Body')
+            with self.subTest(write_behind=write_behind), override_settings(LIKE_COUNTER_WRITE_BEHIND=write_behind), \
+                    mock.patch.object(like_counters, 'start'), mock.patch('posts.likes.notify', wraps=notify) as spy:
+                self.client.force_authenticate(user=self.fans[0])
+                self.client.post(f'/api/posts/{post.id}/like/')
+                self.client.force_authenticate(user=self.author)
+                self.client.get(reverse('notification-list'))
+                
+                self.client.force_authenticate(user=self.fans[1])
+                self.assertEqual(self.client.post(f'/api/posts/{post.id}/like/').status_code, status.HTTP_201_CREATED)
+                self.author.refresh_from_db()
+                self.assertEqual(spy.call_args.args[0].notifications_read_at, self.author.notifications_read_at)
+                self.assertEqual(Notification.objects.filter(recipient=self.author, target_object_id=post.id).count(), 2)
+                self.client.force_authenticate(user=self.author)
+                self.assertEqual(self.client.get(reverse('unread-notification-count')).data['unread_count'], 1)
+            like_counters.flush()
+    
+    def test_read_or_expired_aggregates_start_a_new_row(self):
+        self.like_from(self.fans[0])
+        Notification.objects.update(is_read=True)
+        self.like_from(self.fans[1])
+        self.assertEqual(Notification.objects.count(), 2)
+        
+        Notification.objects.update(timestamp=timezone.now() - timedelta(days=1))
+        self.like_from(self.fans[2])
+        self.assertEqual(Notification.objects.count(), 3)
+
+
+@override_settings(NOTIFICATIONS_ASYNC=False)
+class UnreadCountCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='testpass')
+        self.actors = [User.objects.create_user(username=f'actor{i}', password='testpass') for i in range(3)]
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('unread-notification-count')
+    
+    def test_count_is_served_from_cache(self):
+        notify(self.user, self.actors[0], "started following you")
+        self.assertEqual(self.client.get(self.url).data['unread_count'], 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['unread_count'], 1)
+    
+    def test_new_notifications_increment_cached_count(self):
+        self.assertEqual(self.client.get(self.url).data['unread_count'], 0)
+        notify(self.user, self.actors[0], "started following you")
+        notify(self.user, self.actors[1], "commented on your post")
+        self.assertEqual(cache.get(unread_cache_key(self.user.id)), 2)
+        self.assertEqual(self.client.get(self.url).data['unread_count'], 2)
+    
+    def test_listing_resets_count(self):
+        notify(self.user, self.actors[0], "started following you")
+        self.assertEqual(self.client.get(self.url).data['unread_count'], 1)
+        self.client.get(reverse('notification-list'))
+        self.assertEqual(self.client.get(self.url).data['unread_count'], 0)
+    
+    def test_etag_revalidation(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        notify(self.user, self.actors[0], "started following you")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_reopened_aggregate_drops_cached_count(self):
+        notify(self.user, self.actors[0], "started following you")
+        self.client.get(reverse('notification-list'))
+        etag = self.client.get(self.url)['ETag']
+        
+        # A writer that raced the inbox read merged into the row and moved it past the watermark
+        row = Notification.objects.get(recipient=self.user)
+        Notification.objects.filter(pk=row.pk).update(timestamp=timezone.now())
+        row.reopened = True
+        notifications_created.send(sender=Notification, notifications=[], updated=[row])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['unread_count'], 1)
+    
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='unread-cache-'),
+    }})
+    def test_file_based_cache(self):
+        notify(self.user, self.actors[0], "started following you")
+        self.assertEqual(self.client.get(self.url).data['unread_count'], 1)
+        notify(self.user, self.actors[1], "commented on your post")
+        self.assertEqual(self.client.get(self.url).data['unread_count'], 2)
+
+
+@override_settings(NOTIFICATIONS_ASYNC=False)
+class ReadStateTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='testpass')
+        self.actors = [User.objects.create_user(username=f'actor{i}', password='testpass') for i in range(3)]
+        for verb, actor in zip(["started following you", "liked your post", "commented on your post"], self.actors):
+            notify(self.user, actor, verb)
+        self.client.force_authenticate(user=self.user)
+    
+    def unread_count(self):
+        return self.client.get(reverse('unread-notification-count')).data['unread_count']
+    
+    def test_listing_moves_watermark_without_touching_rows(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('notification-list'))
+        self.assertEqual([n['is_read'] for n in response.data['results']], [False, False, False])
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('accounts_customuser', updates[0])
+        
+        self.assertEqual(self.unread_count(), 0)
+        self.assertTrue(Notification.objects.filter(is_read__isnull=True).exists())
+        response = self.client.get(reverse('notification-list'))
+        self.assertTrue(all(n['is_read'] for n in response.data['results']))
+    
+    def test_new_notifications_after_watermark_are_unread(self):
+        self.client.get(reverse('notification-list'))
+        notify(self.user, self.actors[0], "mentioned you")
+        self.assertEqual(self.unread_count(), 1)
+    
+    def test_mark_read_and_unread_by_id(self):
+        ids = list(Notification.objects.filter(recipient=self.user).values_list('id', flat=True))
+        response = self.client.post(reverse('notifications-mark-read'), {'ids': ids[:2]}, format='json')
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(self.unread_count(), 1)
+        
+        # An explicit unread mark survives the watermark moving past it
+        self.client.get(reverse('notification-list'))
+        self.client.post(reverse('notifications-mark-unread'), {'ids': [ids[0]]}, format='json')
+        self.assertEqual(self.unread_count(), 1)
+    
+    def test_mark_all_read(self):
+        ids = list(Notification.objects.filter(recipient=self.user).values_list('id', flat=True))
+        self.client.post(reverse('notifications-mark-unread'), {'ids': ids[:1]}, format='json')
+        response = self.client.post(reverse('notifications-mark-read'), {'all': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.unread_count(), 0)
+    
+    def test_ids_are_validated(self):
+        response = self.client.post(reverse('notifications-mark-read'), {'ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('notifications-mark-unread'), {'all': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_other_users_notifications_are_untouched(self):
+        other = Notification.objects.create(recipient=self.actors[0], actor=self.user, verb="liked your post")
+        response = self.client.post(reverse('notifications-mark-read'), {'ids': [other.id]}, format='json')
+        self.assertEqual(response.data['updated'], 0)
+        other.refresh_from_db()
+        self.assertIsNone(other.is_read)
+
+
+@override_settings(NOTIFICATIONS_ASYNC=False)
+class StreamTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='listener', password='testpass')
+        self.actor = User.objects.create_user(username='actor', password='testpass')
+    
+    def collect(self, last_event_id=None, count=2, publish=None):
+        """Read `count` frames after the retry line, optionally notifying once subscribed"""
+        async def run():
+            stream = event_stream(self.user, last_event_id, heartbeat=5)
+            frames = [await stream.__anext__()]
+            if publish:
+                await asyncio.to_thread(publish)
+            for _ in range(count):
+                frames.append(await asyncio.wait_for(stream.__anext__(), timeout=5))
+            await stream.aclose()
+            return frames
+        return asyncio.run(run())
+    
+    def test_live_notifications_are_pushed(self):
+        frames = self.collect(count=1, publish=lambda: notify(self.user, self.actor, "started following you"))
+        self.assertTrue(frames[0].startswith('retry: 5000'))
+        self.assertIn('event: notification', frames[1])
+        self.assertIn('"actor_username": "actor"', frames[1])
+    
+    def test_reconnect_replays_missed_notifications(self):
+        notify(self.user, self.actor, "started following you")
+        first = Notification.objects.get()
+        notify(self.user, self.actor, "liked your post")
+        notify(self.user, self.actor, "commented on your post")
+        
+        frames = self.collect(last_event_id=event_id(first))
+        self.assertIn('liked your post', frames[1])
+        self.assertIn('commented on your post', frames[2])
+    
+    def test_stream_requires_authentication(self):
+        response = self.client.get(reverse('notification-stream'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,62 @@
+"""
+Unread notification state.
+
+Read state is a per-user watermark (CustomUser.notifications_read_at) plus
+explicit per-row marks, so reading the inbox is a single-row update instead
+of an UPDATE over every unread notification.
+
+The unread count is cached per user: filled from the database on a miss,
+bumped when new notifications are written and dropped whenever anything is
+marked read or unread, so the next read recounts.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Notification
+
+
+def unread_cache_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def get_unread_count(user):
+    key = unread_cache_key(user.id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.unread_for(user).count()
+        cache.set(key, count, getattr(settings, 'NOTIFICATIONS_UNREAD_CACHE_TIMEOUT', 300))
+    return count
+
+
+def increment_unread(user_id, delta=1):
+    try:
+        cache.incr(unread_cache_key(user_id), delta)
+    except ValueError:
+        # Not cached yet; the next read will count from the database
+        pass
+
+
+def invalidate_unread(user_id):
+    cache.delete(unread_cache_key(user_id))
+
+
+def advance_read_watermark(user, timestamp):
+    """Mark everything up to `timestamp` read with a single-row update on the user"""
+    User = get_user_model()
+    moved = (User.objects.filter(pk=user.pk)
+             .filter(Q(notifications_read_at__isnull=True) | Q(notifications_read_at__lt=timestamp))
+             .update(notifications_read_at=timestamp))
+    if moved:
+        user.notifications_read_at = timestamp
+        invalidate_unread(user.id)
+    return bool(moved)
+
+
+def mark_notifications(user, ids, is_read):
+    """Explicitly mark some of the user's notifications read or unread"""
+    updated = Notification.objects.filter(recipient=user, id__in=ids).update(is_read=is_read)
+    if updated:
+        invalidate_unread(user.id)
+    return updated
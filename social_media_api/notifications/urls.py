@@ -1,7 +1,13 @@
 from django.urls import path
-from .views import NotificationListView, UnreadNotificationCountView
+from .views import (
+    NotificationListView, UnreadNotificationCountView,
+    MarkNotificationsReadView, MarkNotificationsUnreadView, notification_stream,
+)
 
 urlpatterns = [
     path('', NotificationListView.as_view(), name='notification-list'),
     path('unread-count/', UnreadNotificationCountView.as_view(), name='unread-notification-count'),
-]
\ No newline at end of file
+    path('mark-read/', MarkNotificationsReadView.as_view(), name='notifications-mark-read'),
+    path('mark-unread/', MarkNotificationsUnreadView.as_view(), name='notifications-mark-unread'),
+    path('stream/', notification_stream, name='notification-stream'),
+]
@@ -1,26 +1,99 @@
-from rest_framework import generics, permissions
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from accounts.authentication import CachedTokenAuthentication
 from .models import Notification
-from .serializers import NotificationSerializer
+from .serializers import NotificationSerializer, NotificationIdsSerializer
+from .stream import event_stream
+from .unread import get_unread_count, advance_read_watermark, mark_notifications
 
 class NotificationListView(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user).select_related('actor')
     
     def list(self, request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        notifications = page if page is not None else list(queryset)
+        data = self.get_serializer(notifications, many=True).data
         
-        # Mark notifications as read when fetched
-        Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+        # Mark notifications as read when fetched: move the watermark up to the newest one shown
+        if notifications:
+            advance_read_watermark(request.user, max(n.timestamp for n in notifications))
         
-        return response
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
 
 class UnreadNotificationCountView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request, *args, **kwargs):
-        count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-        return Response({'unread_count': count})
\ No newline at end of file
+        count = get_unread_count(request.user)
+        
+        # Let polling clients revalidate with If-None-Match and get an empty 304
+        etag = f'W/"unread-{request.user.id}-{count}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response({'unread_count': count}, headers=headers)
+
+
+class MarkNotificationsReadView(APIView):
+    """Mark notifications read by id, or everything with {"all": true}"""
+    permission_classes = [permissions.IsAuthenticated]
+    is_read = True
+    
+    def post(self, request, *args, **kwargs):
+        serializer = NotificationIdsSerializer(data=request.data, context={'allow_all': self.is_read})
+        serializer.is_valid(raise_exception=True)
+        
+        if serializer.validated_data.get('all'):
+            # Explicit "unread" marks are rare, so clearing them stays a small write
+            Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=None)
+            advance_read_watermark(request.user, timezone.now())
+            return Response({'read_up_to': request.user.notifications_read_at})
+        
+        updated = mark_notifications(request.user, serializer.validated_data['ids'], self.is_read)
+        return Response({'updated': updated})
+
+
+class MarkNotificationsUnreadView(MarkNotificationsReadView):
+    """Mark notifications unread by id"""
+    is_read = False
+
+
+async def _stream_user(request):
+    try:
+        authenticated = await sync_to_async(CachedTokenAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    if authenticated is not None:
+        return authenticated[0]
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+async def notification_stream(request):
+    """
+    Server-Sent Events feed of new notifications for the current user.
+    Plain async Django view so an open connection does not hold a worker thread.
+    """
+    user = await _stream_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+    response = StreamingHttpResponse(
+        event_stream(user, request.headers.get('Last-Event-ID')),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
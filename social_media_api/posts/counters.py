@@ -0,0 +1,161 @@
+"""
+Write-behind buffer for Post.likes_count.
+
+Every like used to UPDATE its post's row, so a viral post serialized all
+its likers on one row lock. like_post and unlike_post now add their +1/-1
+to an in-process buffer once their transaction commits. A background
+thread folds the buffer into one UPDATE per post every
+LIKE_COUNTER_FLUSH_INTERVAL seconds.
+
+The buffer is split into LIKE_COUNTER_SHARDS dicts, each with its own
+lock, so request threads rarely wait on each other. Serializers add
+pending() to the stored value, so a process sees its own likes right
+away. Other processes see them after the next flush. Deltas still
+buffered when a process dies are lost, and reconcile_counters repairs
+that drift. With LIKE_COUNTER_WRITE_BEHIND = False the counter is
+updated inline instead.
+
+Each process has its own buffer, so reconcile_counters cannot flush them
+all. Any delta still buffered while it recounts would be added on top of
+the recount by the next flush. The recount therefore runs inside
+paused(). That writes a CounterPause row, which every process reads at
+most once per interval. While the row exists, likes are counted inline.
+paused() waits until every process has noticed the row and flushed
+what it buffered before, then runs the recount. Only one reconcile may
+run at a time. If a reconcile is killed, its row stays behind and likes
+are counted inline until the next reconcile finishes.
+"""
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import CounterPause
+from .signals import adjust_post_counter
+
+logger = logging.getLogger(__name__)
+
+
+def is_write_behind():
+    return getattr(settings, 'LIKE_COUNTER_WRITE_BEHIND', True)
+
+
+class CounterBuffer:
+    def __init__(self, field, shards, interval):
+        self.field = field
+        self.interval = interval
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._pause_state = (False, None)  # (paused, time.monotonic() of the last check)
+
+    def _shard(self, post_id):
+        return self._shards[post_id % len(self._shards)]
+
+    def add(self, post_id, delta):
+        self.start()
+        deltas, lock = self._shard(post_id)
+        with lock:
+            deltas[post_id] = deltas.get(post_id, 0) + delta
+
+    def pending(self, post_id):
+        """Delta not yet written to the database"""
+        deltas, lock = self._shard(post_id)
+        with lock:
+            return deltas.get(post_id, 0)
+
+    def value(self, post):
+        return max(0, getattr(post, self.field) + self.pending(post.id))
+
+    def _drain(self):
+        drained = {}
+        for deltas, lock in self._shards:
+            with lock:
+                drained.update(deltas)
+                deltas.clear()
+        return drained
+
+    def flush(self):
+        """Write every pending delta, one UPDATE per post; returns the number of posts updated"""
+        with self._flush_lock:
+            drained = {post_id: delta for post_id, delta in self._drain().items() if delta}
+            if not drained:
+                return 0
+            try:
+                with transaction.atomic():
+                    for post_id, delta in sorted(drained.items()):
+                        adjust_post_counter(post_id, self.field, delta)
+            except Exception:
+                # Put the deltas back so the next flush retries them
+                for post_id, delta in drained.items():
+                    deltas, lock = self._shard(post_id)
+                    with lock:
+                        deltas[post_id] = deltas.get(post_id, 0) + delta
+                raise
+            return len(drained)
+
+    def is_paused(self):
+        """Whether a reconcile is recounting this field; re-read from the database at most once per interval"""
+        paused, checked_at = self._pause_state
+        now = time.monotonic()
+        if checked_at is None or now - checked_at >= self.interval:
+            paused = CounterPause.objects.filter(counter=self.field).exists()
+            self._pause_state = (paused, now)
+        return paused
+
+    @contextmanager
+    def paused(self):
+        """Count this field inline in every process while the block runs"""
+        CounterPause.objects.update_or_create(counter=self.field, defaults={'started_at': timezone.now()})
+        try:
+            # Within one interval every process sees the pause and stops buffering.
+            # Within one more its flusher has written what it buffered before that.
+            time.sleep(3 * self.interval)
+            self.flush()
+            yield
+        finally:
+            CounterPause.objects.filter(counter=self.field).delete()
+            self._pause_state = (False, None)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name=f'{self.field}-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush %s", self.field)
+            finally:
+                close_old_connections()
+
+    def shutdown(self):
+        with self._start_lock:
+            if self._thread is None:
+                return
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+like_counters = CounterBuffer(
+    'likes_count',
+    shards=getattr(settings, 'LIKE_COUNTER_SHARDS', 16),
+    interval=getattr(settings, 'LIKE_COUNTER_FLUSH_INTERVAL', 1.0),
+)
+atexit.register(like_counters.shutdown)
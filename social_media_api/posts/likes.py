@@ -0,0 +1,125 @@
+"""
+Like and unlike without read-then-write races.
+
+A like is one INSERT ... SELECT ... ON CONFLICT DO NOTHING. Selecting the
+row from posts_post inside the insert checks that the post exists, with
+no separate lookup beforehand. The unique (user, post) index turns a
+duplicate into a no-op instead of an IntegrityError. An unlike is one
+DELETE ... RETURNING. Only the request that actually inserted or deleted
+a row moves likes_count: through posts.counters.like_counters once the
+transaction commits, or in the same transaction when
+LIKE_COUNTER_WRITE_BEHIND is off or reconcile_counters is running.
+
+The SQL runs on SQLite (3.35+) and PostgreSQL.
+"""
+import datetime
+from enum import Enum
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from notifications.dispatch import notify
+from .counters import is_write_behind, like_counters
+from .models import Post, Like
+
+
+class LikeResult(Enum):
+    CREATED = 'created'
+    DELETED = 'deleted'
+    UNCHANGED = 'unchanged'
+    NO_POST = 'no_post'
+
+
+def _tables():
+    return connection.ops.quote_name(Like._meta.db_table), connection.ops.quote_name(Post._meta.db_table)
+
+
+def _author_columns(posts):
+    """Select list for the post's author: (id, notifications_read_at), so the notification gets a real recipient"""
+    users = connection.ops.quote_name(get_user_model()._meta.db_table)
+    return f'author_id, (SELECT notifications_read_at FROM {users} WHERE {users}.id = {posts}.author_id)'
+
+
+def _author(row):
+    """Unsaved recipient built from an _author_columns row, or None"""
+    if row is None:
+        return None
+    author_id, read_at = row
+    # A raw cursor hands back SQLite datetimes as naive UTC text
+    if isinstance(read_at, str):
+        read_at = parse_datetime(read_at)
+    if read_at is not None and settings.USE_TZ and timezone.is_naive(read_at):
+        read_at = timezone.make_aware(read_at, datetime.timezone.utc)
+    return get_user_model()(id=author_id, notifications_read_at=read_at)
+
+
+def _post_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _count_like(cursor, post_id, delta):
+    """Move the counter, now or after commit; returns the post's author when that comes for free"""
+    if is_write_behind() and not like_counters.is_paused():
+        transaction.on_commit(lambda: like_counters.add(post_id, delta))
+        return None
+    _, posts = _tables()
+    # Clamp at zero like adjust_post_counter, so drift can never trip the CHECK constraint
+    cursor.execute(
+        f'UPDATE {posts} SET likes_count = CASE WHEN likes_count + %s < 0 THEN 0 ELSE likes_count + %s END '
+        f'WHERE id = %s RETURNING {_author_columns(posts)}',
+        [delta, delta, post_id],
+    )
+    return _author(cursor.fetchone())
+
+
+def _author_of(cursor, post_id):
+    """The post's author, or None if the post does not exist. A plain read takes no row lock."""
+    _, posts = _tables()
+    cursor.execute(f'SELECT {_author_columns(posts)} FROM {posts} WHERE id = %s', [post_id])
+    return _author(cursor.fetchone())
+
+
+def like_post(user, post_id):
+    """Like a post; returns (LikeResult, Like or None). Safe to repeat and to race."""
+    post_id = _post_id(post_id)
+    if post_id is None:
+        return LikeResult.NO_POST, None
+    likes, posts = _tables()
+    created_at = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {likes} (user_id, post_id, created_at) '
+            f'SELECT %s, id, %s FROM {posts} WHERE id = %s '
+            f'ON CONFLICT (user_id, post_id) DO NOTHING RETURNING id',
+            [user.id, connection.ops.adapt_datetimefield_value(created_at), post_id],
+        )
+        row = cursor.fetchone()
+        if row is None:
+            # Nothing inserted: either already liked or no such post
+            return (LikeResult.UNCHANGED if _author_of(cursor, post_id) else LikeResult.NO_POST), None
+        author = _count_like(cursor, post_id, 1) or _author_of(cursor, post_id)
+
+    post = Post(id=post_id, author=author)
+    notify(author, user, "liked your post", target=post)
+    return LikeResult.CREATED, Like(id=row[0], user=user, post=post, created_at=created_at)
+
+
+def unlike_post(user, post_id):
+    """Remove a like; returns a LikeResult. Safe to repeat and to race."""
+    post_id = _post_id(post_id)
+    if post_id is None:
+        return LikeResult.NO_POST
+    likes, _ = _tables()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {likes} WHERE user_id = %s AND post_id = %s RETURNING id',
+                       [user.id, post_id])
+        if cursor.fetchone() is None:
+            return LikeResult.UNCHANGED if _author_of(cursor, post_id) else LikeResult.NO_POST
+        _count_like(cursor, post_id, -1)
+    return LikeResult.DELETED
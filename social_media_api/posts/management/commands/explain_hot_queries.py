@@ -0,0 +1,101 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from notifications.models import Notification
+from posts.models import Post, Comment, Like
+
+
+class Command(BaseCommand):
+    help = "Print query plans and timings for the hot post/notification/like queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Insert this many notifications (plus proportional users/posts/likes) first")
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'])
+
+        User = get_user_model()
+        # Prefer a user with a read watermark, so the unread query takes its usual shape
+        user = (User.objects.filter(notifications_read_at__isnull=False).order_by('?').first()
+                or User.objects.order_by('?').first())
+        if user is None:
+            self.stderr.write("No users found; run with --seed")
+            return
+        author_ids = list(User.objects.values_list('id', flat=True)[:50])
+        post = Post.objects.order_by('?').first()
+
+        queries = {
+            'unread notifications': Notification.objects.unread_for(user).values('id'),
+            'notification list': Notification.objects.filter(recipient=user).order_by('-timestamp')[:10],
+            'feed pull path': Post.objects.filter(author_id__in=author_ids).order_by('-created_at', '-id')[:11],
+            'post list page': Post.objects.order_by('-created_at', '-id')[:11],
+            'post comments': Comment.objects.filter(post=post).order_by('created_at', 'id')[:11],
+            'like probe': Like.objects.filter(user=user, post=post),
+        }
+        self.stdout.write(f"Database: {connection.vendor}, "
+                          f"{Notification.objects.count()} notifications, {Post.objects.count()} posts")
+        for name, queryset in queries.items():
+            timings = []
+            for _ in range(options['runs']):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{name}: median {statistics.median(timings):.2f} ms"))
+            self.stdout.write(queryset.explain())
+
+    def seed(self, total):
+        """Quick bulk seed, just enough volume to make the planner choose"""
+        User = get_user_model()
+        batch_size = 10000
+        num_users = max(100, total // 1000)
+        num_posts = max(100, total // 10)
+        now = timezone.now()
+
+        offset = User.objects.count()
+        User.objects.bulk_create(
+            [User(username=f'seed{offset + i}', password='!') for i in range(num_users)],
+            batch_size=batch_size,
+        )
+        user_ids = list(User.objects.values_list('id', flat=True))
+
+        posts = (Post(author_id=random.choice(user_ids), title=f'Seed post {i}', content='Seed content',
+                      created_at=now - timedelta(seconds=i))
+                 for i in range(num_posts))
+        self.bulk(Post, posts, batch_size)
+        post_ids = list(Post.objects.values_list('id', flat=True))
+
+        # Like production: read state comes from the watermark, with a few explicit marks
+        notifications = (Notification(recipient_id=random.choice(user_ids), actor_id=random.choice(user_ids),
+                                      verb='liked your post', is_read=random.choice([True, False] + [None] * 98))
+                         for _ in range(total))
+        first_id = (Notification.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        self.bulk(Notification, notifications, batch_size)
+        # Users have read the oldest 90% of what was just written
+        watermark = (Notification.objects.filter(id__gte=first_id).order_by('id')
+                     .values_list('timestamp', flat=True)[total * 9 // 10])
+        User.objects.filter(notifications_read_at__isnull=True).update(notifications_read_at=watermark)
+
+        likes = (Like(user_id=random.choice(user_ids), post_id=random.choice(post_ids))
+                 for _ in range(num_posts))
+        self.bulk(Like, likes, batch_size, ignore_conflicts=True)
+        self.stdout.write(self.style.SUCCESS(f"Seeded {num_users} users, {num_posts} posts, {total} notifications"))
+
+    def bulk(self, model, rows, batch_size, **kwargs):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                model.objects.bulk_create(batch, **kwargs)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch, **kwargs)
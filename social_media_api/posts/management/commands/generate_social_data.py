@@ -0,0 +1,285 @@
+import random
+import time
+from bisect import bisect
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from notifications.models import Notification
+from posts.models import Post, Comment, Like, TimelineEntry
+from posts.timeline import get_backfill_size, get_fanout_threshold
+
+USERNAME_PREFIX = 'gen'
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let bulk_create keep the timestamps we generate instead of auto_now_add"""
+    previous = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, previous):
+            field.auto_now_add = value
+
+
+class Popularity:
+    """
+    Samples users with probability proportional to rank ** -exponent, which
+    gives in-degrees (followers, likes received) a power-law tail.
+    """
+
+    def __init__(self, user_ids, alpha, rng):
+        # Who ends up popular is random, but the same for a given --seed
+        self.user_ids = list(user_ids)
+        rng.shuffle(self.user_ids)
+        exponent = 1 / (alpha - 1)
+        self.cumulative = list(accumulate((rank + 1) ** -exponent for rank in range(len(self.user_ids))))
+
+    def sample(self, rng):
+        return self.user_ids[bisect(self.cumulative, rng.random() * self.cumulative[-1])]
+
+    def sample_distinct(self, rng, count, exclude=None):
+        count = min(count, len(self.user_ids) - 1)
+        chosen = set()
+        for _ in range(count * 4):
+            if len(chosen) == count:
+                break
+            user_id = self.sample(rng)
+            if user_id != exclude:
+                chosen.add(user_id)
+        return chosen
+
+
+_popularity = {}
+
+
+def get_popularity(user_ids, options):
+    """Built once per process; every shard must sample from the same ranking"""
+    key = (len(user_ids), options['alpha'], options['seed'])
+    if key not in _popularity:
+        _popularity.clear()
+        _popularity[key] = Popularity(user_ids, options['alpha'], random.Random(options['seed']))
+    return _popularity[key]
+
+
+def heavy_tailed(rng, mean, cap):
+    """Pareto-distributed count with the given mean, so a few users are far more active"""
+    shape = 2.0
+    return min(cap, int(rng.paretovariate(shape) * mean * (shape - 1) / shape))
+
+
+def bulk(model, rows, batch_size, **kwargs):
+    written, batch = 0, []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch, **kwargs)
+            written += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch, **kwargs)
+        written += len(batch)
+    return written
+
+
+def _timestamp(rng, options):
+    return options['now'] - timedelta(seconds=rng.random() * options['days'] * 86400)
+
+
+def _shard_rng(options, phase, shard):
+    # One generator per (phase, shard) keeps output identical for any --workers
+    return random.Random(f"{options['seed']}:{phase}:{shard}")
+
+
+def generate_follows(shard, follower_ids, all_user_ids, options):
+    rng = _shard_rng(options, 'follows', shard)
+    popularity = get_popularity(all_user_ids, options)
+    Follow = get_user_model().followers.through
+    edges, notifications = [], []
+    for follower_id in follower_ids:
+        count = heavy_tailed(rng, options['follows'], len(all_user_ids) - 1)
+        for followee_id in popularity.sample_distinct(rng, count, exclude=follower_id):
+            # Through rows (from_customuser=X, to_customuser=Y) mean Y follows X
+            edges.append(Follow(from_customuser_id=followee_id, to_customuser_id=follower_id))
+            notifications.append(Notification(recipient_id=followee_id, actor_id=follower_id,
+                                              verb="started following you", timestamp=_timestamp(rng, options)))
+    with explicit_timestamps(Notification._meta.get_field('timestamp')):
+        return {
+            'follows': bulk(Follow, edges, options['batch_size'], ignore_conflicts=True),
+            'notifications': bulk(Notification, notifications, options['batch_size']),
+        }
+
+
+def generate_posts(shard, author_ids, all_user_ids, options):
+    rng = _shard_rng(options, 'posts', shard)
+    posts = (Post(author_id=author_id, title=f'Post {author_id}-{i}', content='Generated content ' * 8,
+                  created_at=_timestamp(rng, options))
+             for author_id in author_ids
+             for i in range(heavy_tailed(rng, options['posts'], 10000)))
+    return {'posts': bulk(Post, posts, options['batch_size'])}
+
+
+def generate_engagement(shard, posts, all_user_ids, options):
+    rng = _shard_rng(options, 'engagement', shard)
+    popularity = get_popularity(all_user_ids, options)
+    likes, comments, notifications = [], [], []
+    for post_id, author_id, created_at in posts:
+        age = max(1.0, (options['now'] - created_at).total_seconds())
+        for user_id in popularity.sample_distinct(rng, heavy_tailed(rng, options['likes'], 5000)):
+            timestamp = created_at + timedelta(seconds=rng.random() * age)
+            likes.append(Like(user_id=user_id, post_id=post_id, created_at=timestamp))
+            notifications.append(Notification(recipient_id=author_id, actor_id=user_id,
+                                              verb="liked your post", timestamp=timestamp))
+        for i in range(heavy_tailed(rng, options['comments'], 1000)):
+            user_id = popularity.sample(rng)
+            timestamp = created_at + timedelta(seconds=rng.random() * age)
+            comments.append(Comment(post_id=post_id, author_id=user_id, content=f'Generated comment {i}',
+                                    created_at=timestamp))
+            notifications.append(Notification(recipient_id=author_id, actor_id=user_id,
+                                              verb="commented on your post", timestamp=timestamp))
+    notifications = [n for n in notifications if n.recipient_id != n.actor_id]
+    with explicit_timestamps(Like._meta.get_field('created_at'), Notification._meta.get_field('timestamp')):
+        return {
+            'likes': bulk(Like, likes, options['batch_size'], ignore_conflicts=True),
+            'comments': bulk(Comment, comments, options['batch_size']),
+            'notifications': bulk(Notification, notifications, options['batch_size']),
+        }
+
+
+_recent_posts = {}
+
+
+def get_recent_posts(options):
+    """author id -> [(post id, created_at)] that backfill_timeline would copy; loaded once per process"""
+    if options['now'] not in _recent_posts:
+        _recent_posts.clear()
+        pull_ids = get_user_model().objects.filter(followers_count__gte=get_fanout_threshold()).values('id')
+        ranked = (Post.objects.exclude(author_id__in=pull_ids)
+                  .annotate(rank=Window(RowNumber(), partition_by=[F('author_id')],
+                                        order_by=[F('created_at').desc(), F('id').desc()]))
+                  .filter(rank__lte=get_backfill_size()))
+        recent = {}
+        for author_id, post_id, created_at in ranked.values_list('author_id', 'id', 'created_at').iterator():
+            recent.setdefault(author_id, []).append((post_id, created_at))
+        _recent_posts[options['now']] = recent
+    return _recent_posts[options['now']]
+
+
+def generate_timelines(shard, follower_ids, all_user_ids, options):
+    """Same rows as rebuild_timeline, written in bulk for a whole shard instead of one query per follower"""
+    recent = get_recent_posts(options)
+    Follow = get_user_model().followers.through
+    edges = list(Follow.objects.filter(to_customuser_id__in=follower_ids)
+                 .values_list('to_customuser_id', 'from_customuser_id'))
+    entries = (TimelineEntry(owner_id=follower_id, post_id=post_id, created_at=created_at)
+               for follower_id, author_id in edges
+               for post_id, created_at in recent.get(author_id, ()))
+    return {'timeline entries': bulk(TimelineEntry, entries, options['batch_size'], ignore_conflicts=True)}
+
+
+def run_shard(task):
+    function, shard, items, all_user_ids, options = task
+    try:
+        return function(shard, items, all_user_ids, options)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Generate a reproducible synthetic social graph with posts, comments, likes and notifications"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--follows', type=float, default=30, help="Mean accounts followed per user")
+        parser.add_argument('--posts', type=float, default=5, help="Mean posts per user")
+        parser.add_argument('--likes', type=float, default=8, help="Mean likes per post")
+        parser.add_argument('--comments', type=float, default=2, help="Mean comments per post")
+        parser.add_argument('--alpha', type=float, default=2.1,
+                            help="Power-law exponent of the follower distribution (> 1)")
+        parser.add_argument('--days', type=int, default=90, help="Spread timestamps over this many days")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--shard-size', type=int, default=1000, help="Users or posts per worker task")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Writer processes; keep 1 on SQLite, which allows a single writer")
+        parser.add_argument('--skip-timelines', action='store_true',
+                            help="Do not fill the materialized timelines of the new users")
+
+    def handle(self, *args, **options):
+        options['now'] = timezone.now()
+        User = get_user_model()
+        started = time.monotonic()
+
+        with self.phase("users"):
+            offset = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+            users = (User(username=f'{USERNAME_PREFIX}{offset + i}', password='!',
+                          date_joined=options['now'] - timedelta(days=options['days']))
+                     for i in range(options['users']))
+            bulk(User, users, options['batch_size'])
+            user_ids = list(User.objects.filter(username__startswith=USERNAME_PREFIX)
+                            .order_by('id').values_list('id', flat=True))
+            new_user_ids = user_ids[-options['users']:] if options['users'] else []
+            self.stdout.write(f"  {len(new_user_ids)} users")
+
+        with self.phase("follows"):
+            self.report(self.run(generate_follows, new_user_ids, user_ids, options))
+
+        with self.phase("posts"):
+            first_post_id = (Post.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+            self.report(self.run(generate_posts, new_user_ids, user_ids, options))
+
+        with self.phase("likes and comments"):
+            posts = list(Post.objects.filter(id__gte=first_post_id).order_by('id')
+                         .values_list('id', 'author_id', 'created_at'))
+            self.report(self.run(generate_engagement, posts, user_ids, options))
+
+        with self.phase("counters"):
+            call_command('reconcile_counters', stdout=self.stdout)
+        with self.phase("search index"):
+            call_command('rebuild_search_index', stdout=self.stdout)
+        if not options['skip_timelines']:
+            # Only the new users follow anyone new, so theirs are the only timelines to fill
+            with self.phase("timelines"):
+                self.report(self.run(generate_timelines, new_user_ids, user_ids, options))
+
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.monotonic() - started:.1f}s"))
+
+    def run(self, function, items, all_user_ids, options):
+        """Split items into shards and write them, in worker processes if asked"""
+        size = options['shard_size']
+        tasks = [(function, index, items[start:start + size], all_user_ids, options)
+                 for index, start in enumerate(range(0, len(items), size))]
+        totals = {}
+        if options['workers'] > 1 and len(tasks) > 1:
+            # Each worker opens its own connection; never share the parent's across fork
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(run_shard, tasks))
+        else:
+            results = [function(*task[1:]) for task in tasks]
+        for result in results:
+            for key, value in result.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def report(self, totals):
+        self.stdout.write("  " + ", ".join(f"{value} {key}" for key, value in totals.items()))
+
+    @contextmanager
+    def phase(self, name):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Generating {name}..."))
+        started = time.monotonic()
+        yield
+        self.stdout.write(f"  {time.monotonic() - started:.1f}s")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Re-index every post in the configured search backend"
+
+    def handle(self, *args, **options):
+        get_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {Post.objects.count()} posts"))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:12
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Like = apps.get_model('posts', 'Like')
+
+    def count(model):
+        rows = (model.objects.filter(post=OuterRef('pk'))
+                .order_by().values('post').annotate(total=Count('pk')).values('total'))
+        return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+    Post.objects.update(comments_count=count(Comment), likes_count=count(Like))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
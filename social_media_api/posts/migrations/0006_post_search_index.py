@@ -0,0 +1,33 @@
+from django.db import migrations
+
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+    "title, content, tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other databases use another posts.search backend
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_TABLE)
+    schema_editor.execute(
+        "INSERT INTO posts_post_fts (rowid, title, content) SELECT id, title, content FROM posts_post"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE posts_post_fts")
+
+
+class Migration(migrations.Migration):
+    """Full-text index used by posts.search.FTS5Backend"""
+
+    dependencies = [
+        ('posts', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_post_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CounterPause',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('counter', models.CharField(max_length=50, unique=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
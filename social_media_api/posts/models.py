@@ -3,20 +3,87 @@ from django.conf import settings
 from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field='post'):
+    """Correlated COUNT(*) over `model` rows pointing at the outer post"""
+    counts = (model.objects.filter(**{field: OuterRef('pk')})
+              .order_by().values(field).annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def get_embedded_comments_limit():
+    return getattr(settings, 'POST_EMBEDDED_COMMENTS', 10)
+
+
+def comment_preview_queryset():
+    """Comments oldest first, like CommentKeysetPagination, with the author columns joined into the same query"""
+    columns = [field.name for field in Comment._meta.concrete_fields]
+    return Comment.objects.order_by('created_at', 'id').select_related('author').only(*columns, 'author__username')
+
+
+class PostQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Annotate live num_comments/num_likes, used to check the counter columns"""
+        return self.annotate(
+            num_comments=count_subquery(Comment),
+            num_likes=count_subquery(Like),
+        )
+
+    def for_listing(self):
+        """Everything the post serializers read, in a single query"""
+        return self.select_related('author')
+
+    def with_comment_preview(self):
+        """
+        Prefetch each post's first comments into preview_comments. One extra
+        row is fetched to tell whether there are more. The slice becomes a
+        ROW_NUMBER() window, so every post in the page costs one query in total.
+        """
+        preview = comment_preview_queryset()[:get_embedded_comments_limit() + 1]
+        return self.prefetch_related(Prefetch('comments', queryset=preview, to_attr='preview_comments'))
+
+    def with_columns(self, columns):
+        """Load only these columns (QuerySet.only() paths), joining the author only when one is read"""
+        if any(column.startswith('author__') for column in columns):
+            return self.select_related('author').only(*columns)
+        return self.select_related(None).only(*columns)
+
 
 class Post(models.Model):
-    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='posts')
+    # Indexed by post_author_created_idx below, which also covers plain author lookups
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='posts', db_index=False)
     title = models.CharField(max_length=255)
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counters, kept in step by posts.signals
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    
+    objects = PostQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination over all posts: ORDER BY created_at DESC, id DESC
+            models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+            # Feed read path: WHERE author_id IN (...) ORDER BY created_at DESC
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} by {self.author.username}"
 
+    def get_comment_preview(self):
+        """preview_comments as prefetched by with_comment_preview, or the same rows queried now"""
+        if not hasattr(self, 'preview_comments'):
+            self.preview_comments = list(
+                comment_preview_queryset().filter(post=self)[:get_embedded_comments_limit() + 1])
+        return self.preview_comments
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='comments')
@@ -26,6 +93,10 @@ class Comment(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Comments of one post, oldest first
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+        ]
     
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
@@ -37,7 +108,33 @@ class Like(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ['user', 'post']  # Prevent duplicate likes
+        unique_together = ['user', 'post']  # Prevent duplicate likes; its index also serves the (user, post) probe
+
+    def __str__(self):
+        return f"{self.user.username} likes {self.post.title}"
+
+class TimelineEntry(models.Model):
+    """Materialized home-timeline row: `post` shows up in `owner`'s feed."""
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    # Copy of post.created_at so the feed can be paged on this table alone
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at', '-post_id']
+        unique_together = ['owner', 'post']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in timeline of user {self.owner_id}"
+
+
+class CounterPause(models.Model):
+    """Present while reconcile_counters recounts a write-behind counter; see posts.counters"""
+    counter = models.CharField(max_length=50, unique=True)
+    started_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.user.username} likes {self.post.title}"
\ No newline at end of file
+        return f"{self.counter} paused since {self.started_at}"
@@ -0,0 +1,146 @@
+import base64
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(created_at, pk):
+    """Encode a (created_at, id) position as an opaque url-safe token"""
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a token produced by encode_cursor back into (created_at, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise NotFound("Invalid cursor.")
+
+
+def approximate_count(queryset, cap=1000):
+    """
+    Cheap stand-in for queryset.count().
+
+    On PostgreSQL this reads the planner's row estimate; elsewhere it counts
+    at most `cap` rows so the cost stays bounded on very large tables.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset.order_by()[:cap].count()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on (<timestamp>, id).
+
+    Unlike PageNumberPagination there is no COUNT(*) and no OFFSET: each page
+    continues strictly after the last row of the previous one, so deep pages
+    are as cheap as the first and concurrent inserts never shift or repeat
+    rows. Pass ?include_total=true to get an approximate total. When
+    SearchIndexFilter capped the matches, the payload has truncated: true.
+    """
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    total_query_param = 'include_total'
+    ordering = '-created_at'
+    next_cursor = None
+    total = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, view):
+        """Honour ?ordering= from OrderingFilter when it names a keyset-able field"""
+        requested = request.query_params.get('ordering', '').split(',')[0].strip()
+        allowed = getattr(view, 'ordering_fields', None) or []
+        if requested and requested.lstrip('-') in allowed:
+            return requested
+        return self.ordering
+
+    def wants_total(self, request):
+        return request.query_params.get(self.total_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(request, view)
+        field = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+
+        self.total = approximate_count(queryset) if self.wants_total(request) else None
+
+        if descending:
+            queryset = queryset.order_by(f'-{field}', '-id')
+        else:
+            queryset = queryset.order_by(field, 'id')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = decode_cursor(cursor)
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'id__{lookup}': pk})
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_cursor = encode_cursor(getattr(rows[-1], field), rows[-1].id) if self.has_next else None
+        return rows
+
+    def get_next_link(self, cursor=None):
+        cursor = cursor or self.next_cursor
+        if not cursor:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict([('next', self.get_next_link())])
+        if self.total is not None:
+            payload['approximate_total'] = self.total
+        if getattr(self.request, 'search_truncated', False):
+            payload['truncated'] = True
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'approximate_total': {'type': 'integer'},
+                'truncated': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+
+class CommentKeysetPagination(KeysetPagination):
+    """Comments read oldest first"""
+    ordering = 'created_at'
@@ -0,0 +1,277 @@
+"""
+Full-text search over post titles and content.
+
+POST_SEARCH_BACKEND names the backend class:
+
+- FTS5Backend (default) keeps an SQLite FTS5 table, posts_post_fts, next
+  to posts_post. Writes happen in the same transaction as the post.
+- InMemoryBackend keeps an inverted index in process memory, built from
+  the database on first use. Each process only sees its own writes, so
+  it is meant for development and tests.
+
+Both tokenize the same way: words are lowercased with accents removed,
+and every query word must match. Hits are ordered by BM25, with title
+matches weighted TITLE_WEIGHT times higher than content matches. Each
+hit carries the title, and a snippet of the content, as HTML-escaped
+text with the matched words wrapped in <mark>.
+
+posts.signals keeps the index current on post save and delete.
+bulk_create and raw SQL skip those signals; run rebuild_search_index
+after them.
+"""
+import html
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.utils.module_loading import import_string
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Post
+
+TITLE_WEIGHT = 2.0
+SNIPPET_TOKENS = 24
+FTS_TABLE = 'posts_post_fts'
+
+# Markers the backends put around matches before the text is escaped
+MARK_START, MARK_END = '\x02', '\x03'
+
+WORD = re.compile(r'[^\W_]+')
+
+SearchHit = namedtuple('SearchHit', ['post_id', 'score', 'title', 'content'])
+
+
+def normalize(word):
+    """Lowercase and strip accents, like FTS5's unicode61 remove_diacritics"""
+    decomposed = unicodedata.normalize('NFKD', word.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return [normalize(word) for word in WORD.findall(text or '')]
+
+
+def to_html(marked):
+    """Escape marked-up text and turn the markers into <mark> tags"""
+    return html.escape(marked).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def get_max_results():
+    return getattr(settings, 'POST_SEARCH_MAX_RESULTS', 1000)
+
+
+class SearchBackend:
+    def index(self, posts):
+        """Add or replace these posts"""
+        raise NotImplementedError
+
+    def remove(self, post_ids):
+        raise NotImplementedError
+
+    def rebuild(self):
+        """Re-index every post from the database"""
+        raise NotImplementedError
+
+    def search(self, query, limit, offset=0, highlight=True):
+        """SearchHits for the best-ranked matches, best first"""
+        raise NotImplementedError
+
+
+class FTS5Backend(SearchBackend):
+    """
+    Backed by an FTS5 table, created by migration 0006. The table stores
+    its own copy of the text, so highlight() and snippet() work and posts
+    can be replaced by rowid without their old values.
+    """
+
+    def __init__(self):
+        if connection.vendor != 'sqlite':
+            raise ImproperlyConfigured("FTS5Backend needs SQLite; use posts.search.InMemoryBackend instead")
+
+    def index(self, posts):
+        posts = list(posts)
+        self.remove([post.id for post in posts])
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)',
+                               [(post.id, post.title, post.content) for post in posts])
+
+    def remove(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(post_id,) for post_id in post_ids])
+
+    def rebuild(self):
+        posts = connection.ops.quote_name(Post._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, title, content) SELECT id, title, content FROM {posts}')
+
+    def search(self, query, limit, offset=0, highlight=True):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Quoting every word keeps FTS5 query syntax (AND, NEAR, *, ...) out of user input
+        match = ' '.join('"%s"' % term for term in terms)
+        rank = f'bm25({FTS_TABLE}, {TITLE_WEIGHT}, 1.0)'
+        columns = f'rowid, -{rank}'
+        if highlight:
+            columns += (f", highlight({FTS_TABLE}, 0, char(2), char(3)),"
+                        f" snippet({FTS_TABLE}, 1, char(2), char(3), '…', {SNIPPET_TOKENS})")
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {columns} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                           f'ORDER BY {rank} LIMIT %s OFFSET %s', [match, limit, offset])
+            rows = cursor.fetchall()
+        if not highlight:
+            return [SearchHit(post_id, score, None, None) for post_id, score in rows]
+        return [SearchHit(post_id, score, to_html(title), to_html(content))
+                for post_id, score, title, content in rows]
+
+
+class InMemoryBackend(SearchBackend):
+    """Inverted index (term -> {post id: weighted term frequency}) scored with BM25"""
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._built = False
+        self._postings = {}
+        self._terms = {}  # post id -> its Counter of weighted term frequencies
+        self._lengths = {}
+        self._texts = {}
+        self._total_length = 0
+
+    def _add(self, post_id, title, content):
+        title_terms, content_terms = tokenize(title), tokenize(content)
+        frequencies = Counter()
+        for term in title_terms:
+            frequencies[term] += TITLE_WEIGHT
+        for term in content_terms:
+            frequencies[term] += 1
+        for term, frequency in frequencies.items():
+            self._postings.setdefault(term, {})[post_id] = frequency
+        self._terms[post_id] = frequencies
+        self._lengths[post_id] = len(title_terms) + len(content_terms)
+        self._texts[post_id] = (title, content)
+        self._total_length += self._lengths[post_id]
+
+    def _discard(self, post_id):
+        for term in self._terms.pop(post_id, ()):
+            postings = self._postings[term]
+            del postings[post_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(post_id, 0)
+        self._texts.pop(post_id, None)
+
+    def _ensure_built(self):
+        if not self._built:
+            self.rebuild()
+
+    def index(self, posts):
+        with self._lock:
+            self._ensure_built()
+            for post in posts:
+                self._discard(post.id)
+                self._add(post.id, post.title, post.content)
+
+    def remove(self, post_ids):
+        with self._lock:
+            self._ensure_built()
+            for post_id in post_ids:
+                self._discard(post_id)
+
+    def rebuild(self):
+        with self._lock:
+            self._reset()
+            for post_id, title, content in Post.objects.values_list('id', 'title', 'content').iterator():
+                self._add(post_id, title, content)
+            self._built = True
+
+    def search(self, query, limit, offset=0, highlight=True):
+        terms = set(tokenize(query))
+        with self._lock:
+            self._ensure_built()
+            if not terms or any(term not in self._postings for term in terms):
+                return []
+            # Walk the rarest term's postings; every other term must appear too
+            rarest = min(terms, key=lambda term: len(self._postings[term]))
+            total_posts = len(self._lengths)
+            average_length = self._total_length / total_posts
+            idf = {term: math.log((total_posts - len(self._postings[term]) + 0.5)
+                                  / (len(self._postings[term]) + 0.5) + 1) for term in terms}
+            scored = []
+            for post_id in self._postings[rarest]:
+                frequencies = self._terms[post_id]
+                if any(term not in frequencies for term in terms):
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[post_id] / average_length)
+                score = sum(idf[term] * frequencies[term] * (self.k1 + 1) / (frequencies[term] + norm)
+                            for term in terms)
+                scored.append((-score, post_id))
+            scored.sort()
+            page = scored[offset:offset + limit]
+            texts = {post_id: self._texts[post_id] for _, post_id in page}
+
+        if not highlight:
+            return [SearchHit(post_id, -score, None, None) for score, post_id in page]
+        return [SearchHit(post_id, -score, to_html(self._mark(texts[post_id][0], terms)),
+                          to_html(self._mark(texts[post_id][1], terms, SNIPPET_TOKENS)))
+                for score, post_id in page]
+
+    @staticmethod
+    def _mark(text, terms, window=None):
+        """Wrap matched words in markers, trimmed to `window` words around the first match"""
+        words = list(WORD.finditer(text))
+        if not words:
+            return text
+        start, end = 0, len(words)
+        if window is not None and len(words) > window:
+            first = next((i for i, word in enumerate(words) if normalize(word.group()) in terms), 0)
+            start = max(0, min(first - window // 4, len(words) - window))
+            end = start + window
+
+        pieces = ['…' if start > 0 else text[:words[0].start()]]
+        for i in range(start, end):
+            word = words[i].group()
+            pieces.append(f'{MARK_START}{word}{MARK_END}' if normalize(word) in terms else word)
+            if i + 1 < end:
+                pieces.append(text[words[i].end():words[i + 1].start()])
+        pieces.append('…' if end < len(words) else text[words[-1].end():])
+        return ''.join(pieces)
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return _load_backend(getattr(settings, 'POST_SEARCH_BACKEND', 'posts.search.FTS5Backend'))
+
+
+class SearchIndexFilter(BaseFilterBackend):
+    """
+    ?search= through the search index instead of SearchFilter's LIKE '%q%' scans.
+
+    Only the best POST_SEARCH_MAX_RESULTS hits are kept; when there were
+    more, request.search_truncated is set so the paginator can say so.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        max_results = get_max_results()
+        hits = get_backend().search(query, max_results + 1, highlight=False)
+        request.search_truncated = len(hits) > max_results
+        return queryset.filter(id__in=[hit.post_id for hit in hits[:max_results]])
@@ -1,7 +1,96 @@
 from rest_framework import serializers
-from .models import Post, Comment
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
+from .models import Post, Comment, get_embedded_comments_limit
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from .models import Like
+from .pagination import CommentKeysetPagination, encode_cursor
+from .counters import like_counters
+
+
+def _split(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def get_field_selection(request, serializer_class):
+    """
+    (fields, expand) asked for with ?fields=id,title and ?expand=comments.
+
+    fields is None when every field is wanted. Without ?expand= the
+    serializer's default_expand applies, trimmed to ?fields= if given.
+    """
+    params = request.query_params
+    fields = _split(params['fields']) if 'fields' in params else None
+    if 'expand' in params:
+        expand = _split(params['expand'])
+    else:
+        expand = set(serializer_class.default_expand)
+        if fields is not None:
+            expand &= fields
+
+    errors = {}
+    unknown = (fields or set()) - set(serializer_class.Meta.fields) - set(serializer_class.expandable_fields)
+    if unknown:
+        errors['fields'] = f"Unknown field(s): {', '.join(sorted(unknown))}"
+    unknown = expand - set(serializer_class.expandable_fields)
+    if unknown:
+        errors['expand'] = f"Cannot expand: {', '.join(sorted(unknown))}"
+    if errors:
+        raise serializers.ValidationError(errors)
+    return fields, expand
+
+
+class SparseFieldsMixin:
+    """
+    Renders only context['fields'] (all when None) plus the nested
+    serializers named in context['expand'].
+    """
+    # name -> factory for the {field name: field} added, or swapped for the plain one, when expanded
+    expandable_fields = {}
+    default_expand = ()
+    # Model columns a field reads, when that is not just its own name
+    field_columns = {}
+    # Columns an expanded relation needs on the parent row; prefetches need none
+    expanded_columns = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        expand = self.context.get('expand', self.default_expand)
+        if fields is not None:
+            for name in list(self.fields):
+                if name not in fields:
+                    self.fields.pop(name)
+        for name in expand:
+            self.fields.update(self.expandable_fields[name]())
+
+    @classmethod
+    def columns_for(cls, fields, expand):
+        """Arguments for QuerySet.only() that cover the selected fields"""
+        columns = {'id'}
+        for name in (set(cls.Meta.fields) if fields is None else fields) | set(expand):
+            if name in expand:
+                columns.update(cls.expanded_columns.get(name, ()))
+            else:
+                columns.update(cls.field_columns.get(name, (name,)))
+        return columns
+
+
+class AuthorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = get_user_model()
+        fields = ('id', 'username')
+
+
+class BufferedLikesCountField(serializers.ReadOnlyField):
+    """likes_count plus the likes this process has not flushed yet"""
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, post):
+        return like_counters.value(post)
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -13,6 +102,13 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ('id', 'post', 'author', 'author_username', 'content', 'created_at', 'updated_at')
         read_only_fields = ('id', 'author', 'created_at', 'updated_at')
     
+    def get_fields(self):
+        fields = super().get_fields()
+        # Under /posts/<id>/comments/ the post comes from the URL, not the body
+        if self.context.get('post_pk'):
+            fields['post'] = serializers.PrimaryKeyRelatedField(read_only=True)
+        return fields
+    
     def create(self, validated_data):
         # Get the post from context
         post_pk = self.context.get('post_pk')
@@ -20,37 +116,83 @@ class CommentSerializer(serializers.ModelSerializer):
             validated_data['post_id'] = post_pk
         return super().create(validated_data)
 
-class PostSerializer(serializers.ModelSerializer):
+class EmbeddedCommentsField(serializers.Field):
+    """The first POST_EMBEDDED_COMMENTS comments of a post"""
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, post):
+        comments = post.get_comment_preview()[:get_embedded_comments_limit()]
+        return CommentSerializer(comments, many=True, context=self.context).data
+
+
+class CommentsNextField(serializers.Field):
+    """Cursor link to the post's comments endpoint for those not embedded, or None"""
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, post):
+        preview, limit = post.get_comment_preview(), get_embedded_comments_limit()
+        if len(preview) <= limit:
+            return None
+        last = preview[limit - 1]
+        url = reverse('post-comments', args=[post.id])
+        request = self.context.get('request')
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        return replace_query_param(url, CommentKeysetPagination.cursor_query_param,
+                                   encode_cursor(last.created_at, last.id))
+
+
+POST_EXPANDABLE_FIELDS = {
+    'author': lambda: {'author': AuthorSerializer(read_only=True)},
+    'comments': lambda: {'comments': EmbeddedCommentsField(), 'comments_next': CommentsNextField()},
+}
+POST_FIELD_COLUMNS = {
+    'author_username': ('author__username',),
+    'excerpt': ('content',),
+}
+POST_EXPANDED_COLUMNS = {
+    'author': ('author__username',),
+}
+
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author_username = serializers.ReadOnlyField(source='author.username')
-    comments = CommentSerializer(many=True, read_only=True)
-    comments_count = serializers.SerializerMethodField()
+    likes_count = BufferedLikesCountField()
+    
+    expandable_fields = POST_EXPANDABLE_FIELDS
+    default_expand = ('comments',)
+    field_columns = POST_FIELD_COLUMNS
+    expanded_columns = POST_EXPANDED_COLUMNS
     
     class Meta:
         model = Post
         fields = ('id', 'author', 'author_username', 'title', 'content', 
-                 'created_at', 'updated_at', 'comments', 'comments_count')
-        read_only_fields = ('id', 'author', 'created_at', 'updated_at', 'comments')
-    
-    def get_comments_count(self, obj):
-        return obj.comments.count()
+                 'created_at', 'updated_at', 'comments_count', 'likes_count')
+        read_only_fields = ('id', 'author', 'created_at', 'updated_at',
+                            'comments_count', 'likes_count')
     
     def create(self, validated_data):
         # Set the author to the current user
         validated_data['author'] = self.context['request'].user
         return super().create(validated_data)
 
-class PostListSerializer(serializers.ModelSerializer):
+class PostListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author_username = serializers.ReadOnlyField(source='author.username')
-    comments_count = serializers.SerializerMethodField()
     excerpt = serializers.SerializerMethodField()
+    likes_count = BufferedLikesCountField()
+    
+    expandable_fields = POST_EXPANDABLE_FIELDS
+    field_columns = POST_FIELD_COLUMNS
+    expanded_columns = POST_EXPANDED_COLUMNS
     
     class Meta:
         model = Post
         fields = ('id', 'author', 'author_username', 'title', 'excerpt', 
-                 'created_at', 'updated_at', 'comments_count')
-    
-    def get_comments_count(self, obj):
-        return obj.comments.count()
+                 'created_at', 'updated_at', 'comments_count', 'likes_count')
     
     def get_excerpt(self, obj):
         return obj.content[:100] + '...' if len(obj.content) > 100 else obj.content
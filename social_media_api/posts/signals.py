@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Post, Comment, Like, TimelineEntry
+from .search import get_backend
+from .timeline import backfill_timeline, remove_authors_from_timeline
+
+User = get_user_model()
+
+
+@receiver(m2m_changed, sender=User.followers.through)
+def sync_timeline_on_follow(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep materialized timelines in step with follow/unfollow"""
+    # reverse=True means the change went through `following` (instance is the follower)
+    if action == 'pre_clear':
+        if reverse:
+            TimelineEntry.objects.filter(owner=instance).delete()
+        else:
+            TimelineEntry.objects.filter(post__author=instance).delete()
+        return
+
+    if action not in ('post_add', 'post_remove'):
+        return
+
+    if not pk_set:
+        return
+    if reverse:
+        # instance followed (or unfollowed) every author in pk_set
+        if action == 'post_add':
+            authors = User.objects.only('id', 'followers_count').in_bulk(pk_set).values()
+            backfill_timeline(instance.id, authors)
+        else:
+            remove_authors_from_timeline(instance.id, pk_set)
+    else:
+        # every user in pk_set followed (or unfollowed) instance
+        for follower_id in pk_set:
+            if action == 'post_add':
+                backfill_timeline(follower_id, [instance])
+            else:
+                remove_authors_from_timeline(follower_id, [instance.id])
+
+
+def adjust_post_counter(post_id, field, delta):
+    """Atomically add delta to one of the Post counter columns"""
+    # Clamp at zero so a drifted counter can never trip the CHECK constraint
+    Post.objects.filter(pk=post_id).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+@receiver(post_save, sender=Like)
+def count_like(sender, instance, created, **kwargs):
+    if created:
+        adjust_post_counter(instance.post_id, 'likes_count', 1)
+
+
+@receiver(post_delete, sender=Like)
+def uncount_like(sender, instance, **kwargs):
+    adjust_post_counter(instance.post_id, 'likes_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        adjust_post_counter(instance.post_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    adjust_post_counter(instance.post_id, 'comments_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    """Keep the search index current; saves that leave the text alone are skipped"""
+    if update_fields is not None and not {'title', 'content'} & set(update_fields):
+        return
+    get_backend().index([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    get_backend().remove([instance.id])
@@ -1,10 +1,23 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from .models import Post, Comment,Like
+from .models import Post, Comment,Like, TimelineEntry, CounterPause
+from .counters import like_counters
+from .likes import LikeResult, like_post, unlike_post
+from .search import _load_backend
+from .timeline import fan_out_post
 from accounts.models import CustomUser
+from notifications.models import Notification
 
 User = get_user_model()
 
@@ -161,4 +174,472 @@ class LikeTests(APITestCase):
         url = f'/api/posts/{self.post.id}/unlike/'
         response = self.client.post(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertFalse(Like.objects.filter(user=self.user, post=self.post).exists())
\ No newline at end of file
+        self.assertFalse(Like.objects.filter(user=self.user, post=self.post).exists())
+    
+    @override_settings(LIKE_COUNTER_WRITE_BEHIND=False)
+    def test_like_and_unlike_are_single_statements(self):
+        ContentType.objects.get_for_model(Post)  # Warm the cache the notification target reads
+        with CaptureQueriesContext(connection) as queries:
+            result, like = like_post(self.user, self.post.id)
+        self.assertEqual(result, LikeResult.CREATED)
+        self.assertEqual([q['sql'].split()[0] for q in queries if 'SAVEPOINT' not in q['sql']], ['INSERT', 'UPDATE'])
+        self.assertEqual(like_post(self.user, self.post.id)[0], LikeResult.UNCHANGED)
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(unlike_post(self.user, self.post.id), LikeResult.DELETED)
+        self.assertEqual([q['sql'].split()[0] for q in queries if 'SAVEPOINT' not in q['sql']], ['DELETE', 'UPDATE'])
+        self.assertEqual(unlike_post(self.user, self.post.id), LikeResult.UNCHANGED)
+        
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertEqual(like_post(self.user, self.post.id + 1000)[0], LikeResult.NO_POST)
+    
+    @override_settings(NOTIFICATIONS_ASYNC=False)
+    @mock.patch.object(like_counters, 'start')
+    def test_buffered_likes_are_read_back_before_flush(self, start):
+        # No flusher thread: it would race the assertions and block on this test's open transaction
+        like_counters.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.id}/').data['likes_count'], 1)
+        
+        # Another like and an unlike net out to one UPDATE for this post
+        with self.captureOnCommitCallbacks(execute=True):
+            like_post(self.other_user, self.post.id)
+            unlike_post(self.user, self.post.id)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(like_counters.flush(), 1)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+    
+    def test_like_missing_post_returns_404(self):
+        response = self.client.post(f'/api/posts/{self.post.id + 1000}/like/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class FeedTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='reader', password='testpass')
+        self.author = CustomUser.objects.create_user(username='author', password='testpass')
+        self.stranger = CustomUser.objects.create_user(username='stranger', password='testpass')
+        self.user.follow(self.author)
+        self.client.force_authenticate(user=self.user)
+    
+    def test_new_post_is_fanned_out_to_followers(self):
+        self.client.force_authenticate(user=self.author)
+        self.client.post(reverse('post-list'), {'title': 'Hello', 'content': 'World'})
+        post = Post.objects.get(title='Hello')
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user, post=post).exists())
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.stranger, post=post).exists())
+    
+    def test_feed_only_contains_followed_authors(self):
+        Post.objects.create(author=self.stranger, title='Hidden', content='Not followed')
+        self.client.force_authenticate(user=self.author)
+        self.client.post(reverse('post-list'), {'title': 'Visible', 'content': 'Followed'})
+        
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('user-feed'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['title'] for p in response.data['posts']], ['Visible'])
+    
+    def test_follow_backfills_and_unfollow_removes(self):
+        post = Post.objects.create(author=self.stranger, title='Old post', content='Before follow')
+        self.user.follow(self.stranger)
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user, post=post).exists())
+        self.user.unfollow(self.stranger)
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.user, post=post).exists())
+    
+    def test_feed_cursor_pagination(self):
+        for i in range(15):
+            post = Post.objects.create(author=self.author, title=f'Post {i}', content='Body')
+            fan_out_post(post)
+        
+        response = self.client.get(reverse('user-feed'))
+        self.assertEqual(len(response.data['posts']), 10)
+        self.assertIsNotNone(response.data['next'])
+        
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['posts']), 5)
+        self.assertIsNone(response.data['next'])
+    
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+    def test_large_authors_are_merged_on_read(self):
+        self.author.refresh_from_db()
+        post = Post.objects.create(author=self.author, title='Celebrity post', content='Body')
+        self.assertEqual(fan_out_post(post), 0)
+        
+        response = self.client.get(reverse('user-feed'))
+        self.assertEqual([p['title'] for p in response.data['posts']], ['Celebrity post'])
+    
+    def test_approximate_total_counts_pulled_posts(self):
+        fan_out_post(Post.objects.create(author=self.author, title='Fanned out', content='Body'))
+        with override_settings(TIMELINE_FANOUT_THRESHOLD=1):
+            Post.objects.create(author=self.author, title='Pulled', content='Body')
+            response = self.client.get(reverse('user-feed'), {'include_total': 'true'})
+        self.assertEqual(len(response.data['posts']), 2)
+        self.assertEqual(response.data['approximate_total'], 2)
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='pager', password='testpass')
+        self.post = Post.objects.create(author=self.user, title='Base', content='Body')
+        for i in range(25):
+            Post.objects.create(author=self.user, title=f'Post {i}', content='Body')
+    
+    def collect(self, url, params=None):
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            seen.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                return seen
+            response = self.client.get(response.data['next'])
+    
+    def test_post_list_walks_every_post_once(self):
+        seen = self.collect(reverse('post-list'))
+        self.assertEqual(len(seen), 26)
+        self.assertEqual(len(set(seen)), 26)
+        self.assertEqual(seen, list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+    
+    def test_inserts_do_not_shift_pages(self):
+        response = self.client.get(reverse('post-list'))
+        first_page = [item['id'] for item in response.data['results']]
+        Post.objects.create(author=self.user, title='Newest', content='Body')
+        response = self.client.get(response.data['next'])
+        second_page = [item['id'] for item in response.data['results']]
+        self.assertFalse(set(first_page) & set(second_page))
+        self.assertEqual(len(second_page), 10)
+    
+    def test_approximate_total_is_opt_in(self):
+        response = self.client.get(reverse('post-list'))
+        self.assertNotIn('approximate_total', response.data)
+        response = self.client.get(reverse('post-list'), {'include_total': 'true'})
+        self.assertEqual(response.data['approximate_total'], 26)
+    
+    def test_comments_are_paged_oldest_first(self):
+        for i in range(12):
+            Comment.objects.create(post=self.post, author=self.user, content=f'Comment {i}')
+        seen = self.collect(reverse('post-comments', kwargs={'pk': self.post.pk}))
+        self.assertEqual(seen, list(self.post.comments.order_by('created_at', 'id').values_list('id', flat=True)))
+    
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('post-list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class QueryCountTests(APITestCase):
+    """Guard against N+1 regressions: query counts must not grow with page size"""
+    
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='reader', password='testpass')
+        authors = [CustomUser.objects.create_user(username=f'author{i}', password='testpass') for i in range(3)]
+        for author in authors:
+            self.user.follow(author)
+        for i in range(12):
+            post = Post.objects.create(author=authors[i % 3], title=f'Post {i}', content='Body')
+            fan_out_post(post)
+            Comment.objects.create(post=post, author=authors[(i + 1) % 3], content='Nice')
+            Like.objects.create(post=post, user=authors[(i + 2) % 3])
+        self.post = post
+        for i in range(12):
+            Comment.objects.create(post=self.post, author=authors[i % 3], content=f'Comment {i}')
+        self.client.force_authenticate(user=self.user)
+    
+    def count_queries(self, url, page_size):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'page_size': page_size})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+    
+    def assert_constant_queries(self, url):
+        self.assertEqual(self.count_queries(url, 2), self.count_queries(url, 10))
+    
+    def test_post_list(self):
+        self.assert_constant_queries(reverse('post-list'))
+    
+    def test_user_feed(self):
+        self.assert_constant_queries(reverse('user-feed'))
+    
+    def test_post_comments(self):
+        self.assert_constant_queries(reverse('post-comments', kwargs={'pk': self.post.pk}))
+    
+    def test_post_detail(self):
+        url = reverse('post-detail', kwargs={'pk': self.post.pk})
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.data['comments_count'], 13)
+        self.assertEqual(response.data['likes_count'], 1)
+    
+    @override_settings(POST_EMBEDDED_COMMENTS=10)
+    def test_post_detail_embeds_first_comments_with_cursor(self):
+        response = self.client.get(reverse('post-detail', kwargs={'pk': self.post.pk}))
+        embedded = response.data['comments']
+        self.assertEqual(len(embedded), 10)
+        self.assertEqual(embedded[0]['content'], 'Nice')
+        
+        rest = self.client.get(response.data['comments_next'])
+        self.assertEqual([c['content'] for c in rest.data['results']], ['Comment 9', 'Comment 10', 'Comment 11'])
+        self.assertIsNone(rest.data['next'])
+    
+    @override_settings(POST_EMBEDDED_COMMENTS=2)
+    def test_expanded_comments_are_windowed_per_post(self):
+        url = reverse('post-list')
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url, {'page_size': 2, 'expand': 'comments'})
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url, {'page_size': 10, 'expand': 'comments'})
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        first = response.data['results'][0]
+        self.assertEqual(len(first['comments']), 2)
+        self.assertIsNotNone(first['comments_next'])
+        self.assertIsNone(response.data['results'][1]['comments_next'])
+    
+    def test_list_counts_are_annotated(self):
+        response = self.client.get(reverse('post-list'))
+        first = response.data['results'][0]
+        self.assertEqual(first['comments_count'], 13)
+        self.assertEqual(first['likes_count'], 1)
+
+
+class CounterTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='fan', password='testpass')
+        self.author = CustomUser.objects.create_user(username='writer', password='testpass')
+        self.post = Post.objects.create(author=self.author, title='Counted', content='Body')
+    
+    def test_like_and_comment_counters(self):
+        like = Like.objects.create(user=self.user, post=self.post)
+        comment = Comment.objects.create(post=self.post, author=self.user, content='Hi')
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 1))
+        
+        like.delete()
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (0, 0))
+    
+    def test_follow_counters(self):
+        self.user.follow(self.author)
+        self.user.follow(self.author)
+        self.author.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.user.following_count, 1)
+        
+        self.user.unfollow(self.author)
+        self.user.following.remove(self.author)
+        self.author.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+        self.assertEqual(self.user.following_count, 0)
+    
+    def test_reconcile_command_fixes_drift(self):
+        Like.objects.create(user=self.user, post=self.post)
+        self.user.follow(self.author)
+        Post.objects.update(likes_count=7)
+        CustomUser.objects.update(followers_count=3, following_count=3)
+        
+        with mock.patch.object(like_counters, 'interval', 0):
+            call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.author.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual((self.author.followers_count, self.author.following_count), (1, 0))
+        self.assertEqual((self.user.followers_count, self.user.following_count), (0, 1))
+        self.assertFalse(CounterPause.objects.exists())
+    
+    @override_settings(NOTIFICATIONS_ASYNC=False)
+    def test_likes_are_counted_inline_while_reconcile_runs(self):
+        with mock.patch.object(like_counters, 'interval', 0), mock.patch.object(like_counters, 'start'):
+            with like_counters.paused(), self.captureOnCommitCallbacks(execute=True):
+                like_post(self.user, self.post.id)
+            self.post.refresh_from_db()
+            self.assertEqual(self.post.likes_count, 1)
+            self.assertEqual(like_counters.pending(self.post.id), 0)
+            
+            # Buffering resumes once the pause is lifted
+            with self.captureOnCommitCallbacks(execute=True):
+                unlike_post(self.user, self.post.id)
+            self.assertEqual(like_counters.pending(self.post.id), -1)
+            like_counters.flush()
+
+
+class GenerateSocialDataTests(TestCase):
+    def test_generates_consistent_power_law_dataset(self):
+        out = StringIO()
+        with mock.patch.object(like_counters, 'interval', 0):
+            call_command('generate_social_data', users=200, follows=10, posts=2, likes=4, comments=1,
+                         batch_size=100, shard_size=50, stdout=out)
+        users = CustomUser.objects.filter(username__startswith='gen')
+        self.assertEqual(users.count(), 200)
+        self.assertTrue(Post.objects.exists() and Like.objects.exists() and Comment.objects.exists())
+        self.assertTrue(Notification.objects.filter(verb="started following you").exists())
+        
+        # Counters were reconciled after the bulk inserts
+        self.assertEqual(sum(users.values_list('followers_count', flat=True)),
+                         CustomUser.followers.through.objects.count())
+        self.assertEqual(sum(Post.objects.values_list('likes_count', flat=True)), Like.objects.count())
+        
+        # A handful of accounts collect far more followers than the median one
+        counts = sorted(users.values_list('followers_count', flat=True))
+        self.assertGreater(counts[-1], 5 * max(1, counts[len(counts) // 2]))
+
+
+@override_settings(NOTIFICATIONS_ASYNC=False)
+class ConcurrentLikeTests(TransactionTestCase):
+    @mock.patch.object(like_counters, 'start')
+    def test_parallel_likes_are_counted_once(self, start):
+        author = CustomUser.objects.create_user(username='hot', password='testpass')
+        post = Post.objects.create(author=author, title='Hot', content='Everyone likes this')
+        users = CustomUser.objects.bulk_create(
+            [CustomUser(username=f'fan{i}', password='!') for i in range(250)])
+        
+        def like(user):
+            try:
+                return like_post(user, post.id)[0]
+            finally:
+                connection.close()
+        
+        # 1,000 likes: every fan clicks four times, all at once
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            results = list(pool.map(like, users * 4))
+        like_counters.flush()
+        
+        post.refresh_from_db()
+        self.assertEqual(results.count(LikeResult.CREATED), 250)
+        self.assertEqual(results.count(LikeResult.UNCHANGED), 750)
+        self.assertEqual(Like.objects.filter(post=post).count(), 250)
+        self.assertEqual(post.likes_count, 250)
+
+
+class SearchTests(APITestCase):
+    backends = ['posts.search.FTS5Backend', 'posts.search.InMemoryBackend']
+    
+    def setUp(self):
+        _load_backend.cache_clear()
+        self.user = CustomUser.objects.create_user(username='writer', password='testpass')
+        self.title_hit = Post.objects.create(author=self.user, title='Learning Python', content='Notes from week one')
+        self.content_hit = Post.objects.create(author=self.user, title='Weekend',
+                                               content='Some python <b>scripts</b> and a long walk ' * 3)
+        Post.objects.create(author=self.user, title='Gardening', content='Tomatoes and basil')
+    
+    def tearDown(self):
+        _load_backend.cache_clear()
+    
+    def search(self, query):
+        response = self.client.get('/api/posts/search/', {'q': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results']
+    
+    def test_results_are_ranked_and_highlighted(self):
+        for backend in self.backends:
+            with self.subTest(backend=backend), override_settings(POST_SEARCH_BACKEND=backend):
+                _load_backend.cache_clear()
+                results = self.search('PYTHON')
+                self.assertEqual([r['id'] for r in results], [self.title_hit.id, self.content_hit.id])
+                self.assertGreater(results[0]['score'], results[1]['score'])
+                self.assertEqual(results[0]['highlight']['title'], 'Learning <mark>Python</mark>')
+                # Post text is escaped; only the <mark> tags are markup
+                self.assertIn('<mark>python</mark> &lt;b&gt;scripts', results[1]['highlight']['content'])
+                self.assertEqual(self.search('python gardening'), [])
+    
+    def test_index_follows_saves_and_deletes(self):
+        for backend in self.backends:
+            with self.subTest(backend=backend), override_settings(POST_SEARCH_BACKEND=backend):
+                _load_backend.cache_clear()
+                post = Post.objects.create(author=self.user, title='Café review', content='Espresso')
+                self.assertEqual([r['id'] for r in self.search('cafe')], [post.id])
+                
+                post.content = 'Flat white'
+                post.save()
+                self.assertEqual(self.search('espresso'), [])
+                self.assertEqual([r['id'] for r in self.search('white')], [post.id])
+                
+                post.delete()
+                self.assertEqual(self.search('white'), [])
+    
+    def test_list_search_uses_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('post-list'), {'search': 'python'})
+        self.assertEqual({p['id'] for p in response.data['results']}, {self.title_hit.id, self.content_hit.id})
+        self.assertFalse(any('LIKE' in q['sql'] for q in queries))
+    
+    def test_list_search_flags_capped_results(self):
+        url = reverse('post-list')
+        with override_settings(POST_SEARCH_MAX_RESULTS=1):
+            response = self.client.get(url, {'search': 'python'})
+            self.assertTrue(response.data['truncated'])
+            self.assertEqual(len(response.data['results']), 1)
+        with override_settings(POST_SEARCH_MAX_RESULTS=2):
+            self.assertNotIn('truncated', self.client.get(url, {'search': 'python'}).data)
+    
+    def test_requires_query(self):
+        response = self.client.get('/api/posts/search/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='mobile', password='testpass')
+        self.author = CustomUser.objects.create_user(username='author', password='testpass')
+        self.user.follow(self.author)
+        for i in range(12):
+            post = Post.objects.create(author=self.author, title=f'Post {i}', content='Body ' * 50)
+            fan_out_post(post)
+        self.post = post
+        Comment.objects.create(post=post, author=self.user, content='Nice')
+        self.client.force_authenticate(user=self.user)
+    
+    def test_list_selects_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('post-list'), {'fields': 'id,title'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+        
+        posts_query = next(q['sql'] for q in queries if 'FROM "posts_post"' in q['sql'])
+        self.assertNotIn('"content"', posts_query)
+        self.assertNotIn('accounts_customuser', posts_query)
+        
+        # Paging still works off the ordering column loaded alongside
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+    
+    def test_comments_prefetched_only_when_expanded(self):
+        url = reverse('post-detail', args=[self.post.id])
+        self.assertEqual(len(self.client.get(url).data['comments']), 1)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'id,title'})
+        self.assertEqual(set(response.data), {'id', 'title'})
+        self.assertFalse(any('posts_comment' in q['sql'] for q in queries))
+        
+        response = self.client.get(reverse('post-list'), {'fields': 'id', 'expand': 'comments,author'})
+        first = response.data['results'][0]
+        self.assertEqual(first['author'], {'id': self.author.id, 'username': 'author'})
+        self.assertEqual(first['comments'][0]['content'], 'Nice')
+    
+    def test_nested_comments_action_skips_the_comment_prefetch(self):
+        Comment.objects.bulk_create(
+            [Comment(post=self.post, author=self.user, content=f'Reply {i}') for i in range(30)])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('post-comments', args=[self.post.id]), {'page_size': 5})
+        self.assertEqual(len(response.data['results']), 5)
+        # Only the paginated comment page is read, never every comment of the post
+        comment_queries = [q['sql'] for q in queries if 'FROM "posts_comment"' in q['sql']]
+        self.assertEqual(len(comment_queries), 1)
+        self.assertIn('LIMIT', comment_queries[0])
+
+    def test_feed_fields(self):
+        response = self.client.get(reverse('user-feed'), {'fields': 'id,title,author_username'})
+        self.assertEqual(response.data['posts'][0], {'id': self.post.id, 'title': 'Post 11', 'author_username': 'author'})
+        self.assertIsNotNone(response.data['next'])
+    
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(reverse('post-list'), {'fields': 'id,password', 'expand': 'likes'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'fields', 'expand'})
@@ -0,0 +1,144 @@
+"""
+Materialized home timelines.
+
+Posts are pushed into each follower's TimelineEntry rows when they are
+created (fan-out-on-write). Authors with more than
+TIMELINE_FANOUT_THRESHOLD followers are skipped on write; their posts are
+pulled in at read time and merged with the materialized rows instead.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F, Q, Value, Window
+from django.db.models.functions import RowNumber
+
+from .models import Post, TimelineEntry
+from .pagination import approximate_count, encode_cursor, decode_cursor
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def get_fanout_threshold():
+    return getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 10000)
+
+
+def get_backfill_size():
+    return getattr(settings, 'TIMELINE_BACKFILL_SIZE', 50)
+
+
+def is_pull_author(author):
+    """Authors with very large audiences are read on demand instead of fanned out"""
+    return author.followers_count >= get_fanout_threshold()
+
+
+def fan_out_post(post):
+    """Push a new post into the timeline of every follower of its author"""
+    if is_pull_author(post.author):
+        return 0
+
+    follower_ids = post.author.followers.values_list('id', flat=True)
+    batch = []
+    created = 0
+    for follower_id in follower_ids.iterator(chunk_size=FANOUT_BATCH_SIZE):
+        batch.append(TimelineEntry(owner_id=follower_id, post=post, created_at=post.created_at))
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        created += len(batch)
+    return created
+
+
+def backfill_timeline(owner_id, authors):
+    """
+    Copy the recent posts of newly followed authors into a timeline.
+
+    One INSERT ... SELECT for all of them: each author's latest
+    TIMELINE_BACKFILL_SIZE posts, ranked per author in the database.
+    """
+    author_ids = [author.id for author in authors if not is_pull_author(author)]
+    if not author_ids:
+        return
+    recent = (
+        Post.objects.filter(author_id__in=author_ids)
+        .annotate(
+            owner=Value(owner_id),
+            rank=Window(RowNumber(), partition_by=[F('author_id')], order_by=[F('created_at').desc(), F('id').desc()]),
+        )
+        .filter(rank__lte=get_backfill_size())
+        .order_by()
+        .values_list('owner', 'id', 'created_at')
+    )
+    sql, params = recent.query.sql_with_params()
+    table = connection.ops.quote_name(TimelineEntry._meta.db_table)
+    with connection.cursor() as cursor:
+        # SQLite needs a WHERE before ON CONFLICT to tell the upsert from a join constraint
+        cursor.execute(
+            f'INSERT INTO {table} (owner_id, post_id, created_at) SELECT * FROM ({sql}) recent WHERE true '
+            f'ON CONFLICT (owner_id, post_id) DO NOTHING',
+            params,
+        )
+
+
+def remove_authors_from_timeline(owner_id, author_ids):
+    """Drop the posts of unfollowed authors from a timeline"""
+    TimelineEntry.objects.filter(owner_id=owner_id, post__author_id__in=author_ids).delete()
+
+
+def pull_author_ids(user):
+    """Ids of followed authors whose posts are not fanned out on write"""
+    return list(user.following.filter(followers_count__gte=get_fanout_threshold()).values_list('id', flat=True))
+
+
+def get_feed(user, cursor=None, limit=10, posts=None):
+    """
+    Return one page of the user's home timeline as (posts, next_cursor).
+
+    Pages are keyed on (created_at, id) so deep pages cost the same as the
+    first one and new posts never shift the page boundaries. `posts` is the
+    Post queryset rows are loaded from; it must include created_at.
+    """
+    entries = TimelineEntry.objects.filter(owner=user)
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        entries = entries.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lt=pk))
+    # Page on the timeline index alone, then load the posts in one query
+    post_ids = list(entries.order_by('-created_at', '-post_id').values_list('post_id', flat=True)[:limit + 1])
+    queryset = Post.objects.for_listing() if posts is None else posts
+    posts = list(queryset.filter(id__in=post_ids)) if post_ids else []
+
+    pull_ids = pull_author_ids(user)
+    if pull_ids:
+        pulled = queryset.filter(author_id__in=pull_ids)
+        if cursor:
+            pulled = pulled.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        # An author may have crossed the threshold after some posts were fanned out
+        posts.extend(post for post in pulled.order_by('-created_at', '-id')[:limit + 1] if post.id not in post_ids)
+
+    posts.sort(key=lambda post: (post.created_at, post.id), reverse=True)
+    has_more = len(posts) > limit
+    posts = posts[:limit]
+    next_cursor = encode_cursor(posts[-1].created_at, posts[-1].id) if has_more else None
+    return posts, next_cursor
+
+
+def approximate_feed_total(user, cap=1000):
+    """
+    approximate_count() for the whole feed: the materialized rows plus the
+    posts of pull-model authors, which have no TimelineEntry rows.
+    """
+    total = approximate_count(TimelineEntry.objects.filter(owner=user), cap)
+    pull_ids = pull_author_ids(user)
+    if pull_ids:
+        # Posts fanned out before their author crossed the threshold are already counted
+        pulled = Post.objects.filter(author_id__in=pull_ids).exclude(timeline_entries__owner=user)
+        total += approximate_count(pulled, max(cap - total, 0))
+    return total
+
+
+def rebuild_timeline(user):
+    """Rebuild a user's timeline from scratch out of the authors they follow"""
+    TimelineEntry.objects.filter(owner=user).delete()
+    backfill_timeline(user.id, get_user_model().objects.filter(followers=user).only('id', 'followers_count'))
@@ -5,100 +5,150 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.http import Http404
+from django.db.models import Prefetch
 from django.contrib.contenttypes.fields import GenericForeignKey
-from django.contrib.contenttypes.models import ContentType
 from .models import Post, Comment, Like
-from .serializers import PostSerializer, PostListSerializer, CommentSerializer, LikeSerializer
+from .serializers import (
+    PostSerializer, PostListSerializer, CommentSerializer, LikeSerializer, get_field_selection,
+)
+from .pagination import KeysetPagination, CommentKeysetPagination
+from .likes import LikeResult, like_post, unlike_post
 from .permissions import IsAuthorOrReadOnly
-from notifications.models import Notification
+from .search import get_backend, SearchIndexFilter
+from .timeline import approximate_feed_total, fan_out_post, get_feed
+from notifications.dispatch import notify
 from rest_framework import generics
 from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
+
+
+def select_fields(queryset, serializer_class, fields, expand, extra_columns=(), many=True):
+    """Narrow a Post queryset to what a sparse fieldset reads; comment previews are prefetched only when expanded"""
+    if fields is not None:
+        queryset = queryset.with_columns(serializer_class.columns_for(fields, expand) | set(extra_columns))
+    # A single post reads its preview with a plain LIMIT on the comment index instead,
+    # which beats a window over every comment of a post with thousands of them
+    if 'comments' in expand and many:
+        queryset = queryset.with_comment_preview()
+    return queryset
 
 
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, SearchIndexFilter, filters.OrderingFilter]
     filterset_fields = ['author']
-    search_fields = ['title', 'content']
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
     
-    def get_serializer_class(self):
+    # Reads honour ?fields= and ?expand=; writes always return the full representation
+    sparse_actions = ('list', 'retrieve', 'search')
+    
+    def get_field_selection(self):
+        if self.action not in self.sparse_actions:
+            return None, set(self.get_serializer_class().default_expand)
+        if not hasattr(self, '_field_selection'):
+            self._field_selection = get_field_selection(self.request, self.get_serializer_class())
+        return self._field_selection
+    
+    def get_queryset(self):
+        # Writes and the nested actions (comments, like) never embed comments, so skip the prefetch
+        if self.action not in self.sparse_actions:
+            return Post.objects.for_listing()
+        fields, expand = self.get_field_selection()
+        extra_columns = ()
         if self.action == 'list':
+            # The keyset cursor is built from the ordering column
+            extra_columns = (self.paginator.get_ordering(self.request, self).lstrip('-'),)
+        return select_fields(Post.objects.for_listing(), self.get_serializer_class(), fields, expand, extra_columns,
+                             many=self.action != 'retrieve')
+    
+    def get_serializer_class(self):
+        if self.action in ('list', 'search'):
             return PostListSerializer
         return PostSerializer
     
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'], context['expand'] = self.get_field_selection()
+        return context
+    
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        fan_out_post(post)
     
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
-        post = generics.get_object_or_404(Post, pk=pk)  
-        user = request.user
-        like, created = Like.objects.get_or_create(user=request.user, post=post)  
-        
-        if not created:
+        result, like = like_post(request.user, pk)
+        if result is LikeResult.NO_POST:
+            raise Http404
+        if result is LikeResult.UNCHANGED:
             return Response({"error": "You have already liked this post."}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create notification if it's not the user's own post
-        if post.author != user:
-            Notification.objects.create(
-                recipient=post.author,
-                actor=user,
-                verb="liked your post",
-                target=post,
-                content_type=ContentType.objects.get_for_model(post),
-                object_id=post.id
-            )
-        
         serializer = LikeSerializer(like)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'])
     def unlike(self, request, pk=None):
-        post = generics.get_object_or_404(Post, pk=pk)  
-        user = request.user
-        
-        try:
-            like = Like.objects.get(user=request.user, post=post)  
-            like.delete()
-            return Response({"message": "Post unliked successfully."}, status=status.HTTP_200_OK)
-        except Like.DoesNotExist:
+        result = unlike_post(request.user, pk)
+        if result is LikeResult.NO_POST:
+            raise Http404
+        if result is LikeResult.UNCHANGED:
             return Response({"error": "You have not liked this post."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": "Post unliked successfully."}, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """?q= ranked by relevance, with highlighted title and content snippet"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Pass a search query as ?q=."}, status=status.HTTP_400_BAD_REQUEST)
+        paginator = KeysetPagination()
+        limit = paginator.get_page_size(request)
+        try:
+            offset = max(0, int(request.query_params.get('offset', 0)))
+        except ValueError:
+            offset = 0
+        
+        hits = get_backend().search(query, limit + 1, offset)
+        has_more = len(hits) > limit
+        hits = hits[:limit]
+        posts = self.get_queryset().in_bulk([hit.post_id for hit in hits])
+        results = []
+        for hit in hits:
+            # The index can briefly name a post deleted by another process
+            if hit.post_id in posts:
+                data = self.get_serializer(posts[hit.post_id]).data
+                data.update(score=hit.score, highlight={'title': hit.title, 'content': hit.content})
+                results.append(data)
+        
+        next_url = None
+        if has_more:
+            next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + limit)
+        return Response({'next': next_url, 'results': results})
     
     @action(detail=True, methods=['get', 'post'])
     def comments(self, request, pk=None):
         post = self.get_object()
         if request.method == 'POST':
-            serializer = CommentSerializer(data=request.data)
+            serializer = CommentSerializer(data=request.data, context={'request': request, 'post_pk': post.pk})
             if serializer.is_valid():
                 comment = serializer.save(author=request.user, post=post)
                 
                 # Create notification for post author if it's not their own comment
-                if post.author != request.user:
-                    Notification.objects.create(
-                        recipient=post.author,
-                        actor=request.user,
-                        verb="commented on your post",
-                        target=post,
-                        content_type=ContentType.objects.get_for_model(post),
-                        object_id=post.id
-                    )
+                notify(post.author, request.user, "commented on your post", target=post)
                 
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         else:
             # Handle comment listing
-            comments = post.comments.all()
-            page = self.paginate_queryset(comments)
-            if page is not None:
-                serializer = CommentSerializer(page, many=True)
-                return self.get_paginated_response(serializer.data)
-            
-            serializer = CommentSerializer(comments, many=True)
-            return Response(serializer.data)
+            comments = post.comments.select_related('author')
+            paginator = CommentKeysetPagination()
+            page = paginator.paginate_queryset(comments, request, view=self)
+            serializer = CommentSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
 
 
 class CommentViewSet(viewsets.ModelViewSet):
@@ -123,27 +173,24 @@ class CommentViewSet(viewsets.ModelViewSet):
 @permission_classes([IsAuthenticated])
 def user_feed(request):
     """Get posts from users that the current user follows"""
-    following_users = request.user.following.all()
-    posts = Post.objects.filter(author__in=following_users).order_by('-created_at')
-    
-    # Pagination
-    page = request.query_params.get('page', 1)
-    paginator = Paginator(posts, 10)  # 10 posts per page
-    
-    try:
-        posts_page = paginator.page(page)
-    except PageNotAnInteger:
-        posts_page = paginator.page(1)
-    except EmptyPage:
-        posts_page = paginator.page(paginator.num_pages)
-    
-    serializer = PostListSerializer(posts_page, many=True)
-    return Response({
+    paginator = KeysetPagination()
+    paginator.request = request
+    fields, expand = get_field_selection(request, PostListSerializer)
+    posts, next_cursor = get_feed(
+        request.user,
+        cursor=request.query_params.get(paginator.cursor_query_param),
+        limit=paginator.get_page_size(request),
+        posts=select_fields(Post.objects.for_listing(), PostListSerializer, fields, expand, ('created_at',)),
+    )
+    
+    serializer = PostListSerializer(posts, many=True, context={'request': request, 'fields': fields, 'expand': expand})
+    data = {
         'posts': serializer.data,
-        'page': posts_page.number,
-        'pages': paginator.num_pages,
-        'total': paginator.count
-    })
+        'next': paginator.get_next_link(next_cursor),
+    }
+    if paginator.wants_total(request):
+        data['approximate_total'] = approximate_feed_total(request.user)
+    return Response(data)
 
 
 # Add these views for direct URL access (for the URL patterns requirement)
@@ -151,33 +198,22 @@ class LikePostView(generics.CreateAPIView):
     serializer_class = LikeSerializer
     permission_classes = [IsAuthenticated]
     
-    def perform_create(self, serializer):
-        post = generics.get_object_or_404(Post, pk=self.kwargs['pk'])  
-        like, created = Like.objects.get_or_create(user=self.request.user, post=post) 
-        
-        if not created:
+    def create(self, request, *args, **kwargs):
+        result, like = like_post(request.user, self.kwargs['pk'])
+        if result is LikeResult.NO_POST:
+            raise Http404
+        if result is LikeResult.UNCHANGED:
             raise ValidationError("You have already liked this post.")
-        
-        # Create notification
-        if post.author != self.request.user:
-            Notification.objects.create(
-                recipient=post.author,
-                actor=self.request.user,
-                verb="liked your post",
-                target=post,
-                content_type=ContentType.objects.get_for_model(post),
-                object_id=post.id
-            )
+        return Response(self.get_serializer(like).data, status=status.HTTP_201_CREATED)
 
 
 class UnlikePostView(generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
     
     def delete(self, request, *args, **kwargs):
-        post = generics.get_object_or_404(Post, pk=self.kwargs['pk']) 
-        try:
-            like = Like.objects.get(user=request.user, post=post)  
-            like.delete()
-            return Response({"message": "Post unliked successfully."}, status=status.HTTP_200_OK)
-        except Like.DoesNotExist:
-            return Response({"error": "You have not liked this post."}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        result = unlike_post(request.user, self.kwargs['pk'])
+        if result is LikeResult.NO_POST:
+            raise Http404
+        if result is LikeResult.UNCHANGED:
+            return Response({"error": "You have not liked this post."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": "Post unliked successfully."}, status=status.HTTP_200_OK)
@@ -94,10 +94,46 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock at BEGIN and wait for it, instead of failing
+            # with "database is locked" when concurrent writers collide
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # On disk rather than in memory, so tests can exercise concurrent writers
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Any backend works, e.g. CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# with CACHE_LOCATION=/var/tmp/django_cache, or ...db.DatabaseCache with a table name.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='social-media-api'),
+    }
+}
+
+
+# Password hashing: PBKDF2 with a per-environment work factor (accounts.hashers).
+# Django's default is 1,000,000 iterations, roughly 0.5s of CPU for each login.
+PASSWORD_HASHERS = [
+    'accounts.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = config('PASSWORD_HASH_ITERATIONS', default=1_000_000, cast=int)
+
+# login/ returns a token without writing a session unless the client sends
+# {"session": true}; set True to keep creating sessions by default.
+LOGIN_CREATES_SESSION = config('LOGIN_CREATES_SESSION', default=False, cast=bool)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -148,7 +184,7 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -164,6 +200,66 @@ REST_FRAMEWORK = {
 }
 
 
+# Home timeline fan-out
+# Authors with at least this many followers are merged into feeds at read time
+TIMELINE_FANOUT_THRESHOLD = config('TIMELINE_FANOUT_THRESHOLD', default=10000, cast=int)
+# Number of recent posts copied into a timeline when following someone
+TIMELINE_BACKFILL_SIZE = config('TIMELINE_BACKFILL_SIZE', default=50, cast=int)
+
+
+# Post.likes_count is written behind (posts.counters): likes collect in memory
+# and are applied as one UPDATE per post every LIKE_COUNTER_FLUSH_INTERVAL seconds
+LIKE_COUNTER_WRITE_BEHIND = config('LIKE_COUNTER_WRITE_BEHIND', default=True, cast=bool)
+LIKE_COUNTER_FLUSH_INTERVAL = config('LIKE_COUNTER_FLUSH_INTERVAL', default=1.0, cast=float)
+LIKE_COUNTER_SHARDS = 16
+
+
+# Full-text search over posts (posts.search): FTS5Backend on SQLite,
+# or InMemoryBackend for a per-process index
+POST_SEARCH_BACKEND = config('POST_SEARCH_BACKEND', default='posts.search.FTS5Backend')
+# Most hits ?search= on the post list will match
+POST_SEARCH_MAX_RESULTS = config('POST_SEARCH_MAX_RESULTS', default=1000, cast=int)
+
+# Comments embedded in a post's detail response; the rest are behind comments_next
+POST_EMBEDDED_COMMENTS = config('POST_EMBEDDED_COMMENTS', default=10, cast=int)
+
+
+# Token -> user lookups cached per process (accounts.authentication)
+TOKEN_AUTH_CACHE_SIZE = config('TOKEN_AUTH_CACHE_SIZE', default=10000, cast=int)
+# Upper bound on how long a change made elsewhere (e.g. another process) takes to apply
+TOKEN_AUTH_CACHE_TTL = config('TOKEN_AUTH_CACHE_TTL', default=60, cast=int)
+# Also share entries through CACHES['default'] so new processes start warm
+TOKEN_AUTH_SHARED_CACHE = config('TOKEN_AUTH_SHARED_CACHE', default=False, cast=bool)
+
+
+# Profile picture renditions (accounts.thumbnails): square edge length in pixels
+THUMBNAIL_SIZES = {'small': 64, 'medium': 256}
+# When False, renditions are rendered inline after commit instead of on worker threads
+THUMBNAILS_ASYNC = config('THUMBNAILS_ASYNC', default=True, cast=bool)
+THUMBNAILS_WORKERS = config('THUMBNAILS_WORKERS', default=2, cast=int)
+
+
+# Follow graph adjacency cache (accounts.graph), per process
+FOLLOW_GRAPH_CACHE_SIZE = config('FOLLOW_GRAPH_CACHE_SIZE', default=10000, cast=int)
+# Seconds an entry may serve before reloading, bounding staleness from other processes
+FOLLOW_GRAPH_CACHE_TTL = config('FOLLOW_GRAPH_CACHE_TTL', default=60, cast=int)
+
+
+# Notification pipeline
+# When False, notifications are written inline instead of by background workers
+NOTIFICATIONS_ASYNC = config('NOTIFICATIONS_ASYNC', default=True, cast=bool)
+NOTIFICATIONS_QUEUE_SIZE = config('NOTIFICATIONS_QUEUE_SIZE', default=10000, cast=int)
+NOTIFICATIONS_BATCH_SIZE = config('NOTIFICATIONS_BATCH_SIZE', default=500, cast=int)
+NOTIFICATIONS_WORKERS = config('NOTIFICATIONS_WORKERS', default=2, cast=int)
+# Same recipient/verb/target within this many seconds is merged into one notification
+NOTIFICATIONS_COALESCE_WINDOW = config('NOTIFICATIONS_COALESCE_WINDOW', default=3600, cast=int)
+NOTIFICATIONS_ACTOR_SAMPLE_SIZE = 3
+# Seconds a cached unread count may live before it is recounted
+NOTIFICATIONS_UNREAD_CACHE_TIMEOUT = config('NOTIFICATIONS_UNREAD_CACHE_TIMEOUT', default=300, cast=int)
+# Seconds between keep-alive comments on the notification stream (each also runs a catch-up query)
+NOTIFICATIONS_STREAM_HEARTBEAT = config('NOTIFICATIONS_STREAM_HEARTBEAT', default=15, cast=int)
+
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
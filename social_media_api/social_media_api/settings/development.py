@@ -12,10 +12,21 @@ SESSION_COOKIE_SECURE = False
 CSRF_COOKIE_SECURE = False
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
+# Cheaper password hashing locally and in tests
+PASSWORD_HASH_ITERATIONS = config('PASSWORD_HASH_ITERATIONS', default=100_000, cast=int)
+
 # Database
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock at BEGIN and wait for it, instead of failing
+            # with "database is locked" when concurrent writers collide
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # On disk rather than in memory, so tests can exercise concurrent writers
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
\ No newline at end of file